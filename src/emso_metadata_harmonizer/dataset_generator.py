@@ -10,6 +10,7 @@ license: MIT
 created: 13/4/23
 """
 import json
+import os
 import rich
 import pandas as pd
 from .metadata.autofill import expand_minmeta, autofill_waterframe
@@ -17,7 +18,8 @@ from .metadata.dataset import add_coordinates, ensure_coordinates, update_waterf
     load_data, df_to_wf
 from .metadata.merge import merge_waterframes
 from .metadata.minmeta import generate_min_meta_template, load_min_meta, load_full_meta, generate_full_metadata
-from .metadata import EmsoMetadata
+from .metadata import EmsoMetadata, get_emso_metadata
+from .metadata.utils import threadify
 import copy
 
 
@@ -38,23 +40,33 @@ def generate_metadata(data_files: list, folder):
     rich.print(f"[green]Please edit the following files and run the generator with the -m option!")
 
 
-def generate_datasets(data_list: list, metadata_list: list, emso_metadata: EmsoMetadata):
+def generate_datasets(data_list: list, metadata_list: list, emso_metadata: EmsoMetadata, parallel: bool = False):
     """
     Merge data fiiles and metadata files into a NetCDF dataset according to EMSO specs. If provided, depths, lats and
-    longs will be added to the dataset as dimensions.
+    longs will be added to the dataset as dimensions. If parallel is set, all data files are loaded concurrently before
+    processing the metadata.
     """
 
     if emso_metadata:
         emso = emso_metadata
     else:
-        emso = EmsoMetadata()
+        emso = get_emso_metadata()
+
+    # Only data files are loaded in parallel, metadata is processed sequentially as it may ask for user input
+    preloaded = {}
+    if parallel:
+        indexes = [i for i in range(len(data_list)) if type(data_list[i]) is str]
+        tasks = [(data_list[i],) for i in indexes]
+        preloaded = dict(zip(indexes, threadify(tasks, load_data, max_threads=os.cpu_count())))
 
     waterframes = []
     for i in range(len(data_list)):
         data = data_list[i]
         metadata = metadata_list[i]
 
-        if type(data) is str:
+        if i in preloaded:
+            wf = preloaded[i]
+        elif type(data) is str:
             wf = load_data(data)
         elif type(data) is pd.DataFrame:
             wf = df_to_wf(data)
@@ -77,10 +89,10 @@ def generate_datasets(data_list: list, metadata_list: list, emso_metadata: EmsoM
 
         if type(metadata) is str:
             with open(metadata) as f:
-                metadata = json.load(f)
-
-        # Create deep copy of the metadata
-        metadata = copy.deepcopy(metadata)
+                metadata = json.load(f)  # freshly decoded, no need to copy it
+        else:
+            # Create deep copy of the metadata
+            metadata = copy.deepcopy(metadata)
         if minimal_metadata:
             minmeta = load_min_meta(wf, metadata, emso)
 
@@ -102,7 +114,7 @@ def generate_datasets(data_list: list, metadata_list: list, emso_metadata: EmsoM
 
 
 def generate_dataset(data: list, metadata: list, generate: bool = False, autofill: bool = False, output: str = "",
-                     clear: bool = False, emso_metadata=None, multisensor_metadata=True) -> str:
+                     clear: bool = False, emso_metadata=None, multisensor_metadata=True, parallel=False) -> str:
     wf = None
     if clear:
         rich.print("Clearing downloaded files...", end="")
@@ -123,14 +135,10 @@ def generate_dataset(data: list, metadata: list, generate: bool = False, autofil
         exit()
 
     if metadata:
-        waterframes = generate_datasets(data, metadata, emso_metadata=emso_metadata)
+        waterframes = generate_datasets(data, metadata, emso_metadata=emso_metadata, parallel=parallel)
 
         # If ALL water frames are empty we have nothing else to do, just exit
-        some_data = False
-        for wf in waterframes:
-            if not wf.data.empty:
-                some_data = True
-        if not some_data:
+        if all(wf.data.empty for wf in waterframes):
             rich.print("[red]There is not data in the dataframes! exit")
             exit(0)
         wf = merge_waterframes(waterframes)
@@ -8,16 +8,64 @@ email: enoc.martinez@upc.edu
 license: MIT
 created: 28/4/23
 """
+import copy
+import functools
 import os
 import shutil
+import tempfile
 
 import lxml.etree as etree
 from ..metadata.waterframe import WaterFrame
 from ..metadata.dataset import get_variables, set_multisensor, get_dimensions, get_qc_variables
-from ..metadata.xmlutils import get_element
 from datetime import datetime
 import rich
 
+# Data types accepted by ERDDAP for dataVariables
+_valid_data_types = frozenset(("int", "ubyte", "byte", "double", "float", "String"))
+
+# Skeleton of an EDDTableFromMultidimNcFiles dataset, parsed once and copied for every dataset. The datasetID, fileDir,
+# infoUrl and subsetVariables are set on each copy
+_dataset_template = etree.fromstring("""
+<dataset type="EDDTableFromMultidimNcFiles" datasetID="" active="true">
+    <reloadEveryNMinutes>10080</reloadEveryNMinutes>
+    <updateEveryNMillis>10000</updateEveryNMillis>
+    <fileDir></fileDir>
+    <fileNameRegex>.*</fileNameRegex>
+    <recursive>true</recursive>
+    <pathRegex>.*</pathRegex>
+    <metadataFrom>last</metadataFrom>
+    <standardizeWhat>0</standardizeWhat>
+    <removeMVRows>true</removeMVRows>
+    <sortFilesBySourceNames></sortFilesBySourceNames>
+    <fileTableInMemory>false</fileTableInMemory>
+    <addAttributes>
+        <att name="_NCProperties">null</att>
+        <att name="cdm_data_type">Point</att>
+        <att name="infoUrl"></att>
+        <att name="sourceUrl">(local files)</att>
+        <att name="standard_name_vocabulary">CF Standard Name Table v70</att>
+        <att name="subsetVariables"></att>
+    </addAttributes>
+</dataset>
+""", etree.XMLParser(remove_blank_text=True))
+
+# Skeleton of a dataVariable, copied for every variable instead of creating each subelement from scratch
+_data_variable_template = etree.fromstring(
+    "<dataVariable><sourceName/><destinationName/><dataType/><addAttributes/></dataVariable>"
+)
+
+# ERDDAP data type and extra attributes for each (lowercase) dimension, others default to float without attributes
+_erddap_dimension_types = {
+    "time": ("double", {
+        "units": "seconds since 1970-01-01",
+        "time_precision": "1970-01-01T00:00:00Z"
+    }),
+    "depth": ("float", {
+        "units": "m",
+    }),
+    "sensor_id": ("String", {}),
+}
+
 
 def generate_erddap_dataset(wf: WaterFrame, directory, dataset_id):
     """
@@ -27,8 +75,32 @@ def generate_erddap_dataset(wf: WaterFrame, directory, dataset_id):
     :param dataset_id: datsetID to identify the dataset
     returns: a string containing the datasets.xml chunk to setup the dataset
     """
+    if "$multisensor" not in wf.metadata:
+        wf = set_multisensor(wf)
+
+    if "infoUrl" in wf.metadata:  # If infoURL not set, use the edmo uri
+        info_url = wf.metadata["infoUrl"]
+    else:
+        info_url = wf.metadata["institution_edmo_uri"]
+
+    # The XML chunk only depends on these values, so the same configuration is only generated once
+    return _build_erddap_dataset(directory, dataset_id, tuple(get_variables(wf)), tuple(get_qc_variables(wf)),
+                                 bool(wf.metadata["$multisensor"]), str(info_url))
+
+
+@functools.lru_cache(maxsize=128)
+def _build_erddap_dataset(directory, dataset_id, variables: tuple, qc_variables: tuple, multisensor: bool, info_url):
+    """
+    Builds the datasets.xml chunk for a dataset. Cached, as the arguments fully determine the output
+    :param directory: path where the NetCDF files will be stored
+    :param dataset_id: datsetID to identify the dataset
+    :param variables: data variables
+    :param qc_variables: quality control variables
+    :param multisensor: if True, a sensor_id variable is added
+    :param info_url: infoUrl attribute
+    returns: a string containing the datasets.xml chunk
+    """
     dimensions = ["TIME", "LATITUDE", "LONGITUDE", "DEPTH"]  # custom dimensional order
-    qc_variables = get_qc_variables(wf)
 
     # ERDDAP will force dimensions to be lowercase, so let's create a dict with source dest like:
     #     { "TIME": "time" }
@@ -39,78 +111,38 @@ def generate_erddap_dataset(wf: WaterFrame, directory, dataset_id):
     erddap_qc = {}
     for qcvar in qc_variables:
         source = qcvar.replace("_QC", "")
-        if source in dimensions:
-            erddap_qc[qcvar] = source.lower() + "_QC"  # ensure dimension is in lower case
+        if source in erddap_dims:  # dict lookup, erddap_dims only holds dimensions at this point
+            erddap_qc[qcvar] = erddap_dims[source] + "_QC"  # ensure dimension is in lower case
         else:
             erddap_qc[qcvar] = qcvar  # do not modify
 
     # subset variables are QC vars and sensor_id
-    subset_vars_str = ", ".join(erddap_qc.values())
-
-    if "$multisensor" not in wf.metadata.keys():
-        wf = set_multisensor(wf)
+    subset_vars = list(erddap_qc.values())
 
-    if wf.metadata["$multisensor"]:
+    if multisensor:
         erddap_dims["SENSOR_ID"] = "sensor_id"
-        subset_vars_str += ", sensor_id"  # manually add as subset variable
-
+        subset_vars.append("sensor_id")  # manually add as subset variable
 
-    if "infoUrl" in wf.metadata.keys(): # If infoURL not set, use the edmo uri
-        info_url = wf.metadata["infoUrl"]
-    else:
-        info_url = wf.metadata["institution_edmo_uri"]
+    subset_vars_str = ", ".join(subset_vars)
 
-
-    x = f"""
-<dataset type="EDDTableFromMultidimNcFiles" datasetID="{dataset_id}" active="true">
-    <reloadEveryNMinutes>10080</reloadEveryNMinutes>
-    <updateEveryNMillis>10000</updateEveryNMillis>
-    <fileDir>{directory}</fileDir>
-    <fileNameRegex>.*</fileNameRegex>
-    <recursive>true</recursive>    
-    <pathRegex>.*</pathRegex>
-    <metadataFrom>last</metadataFrom>
-    <standardizeWhat>0</standardizeWhat>
-    <removeMVRows>true</removeMVRows>
-    <sortFilesBySourceNames></sortFilesBySourceNames>
-    <fileTableInMemory>false</fileTableInMemory>
-    <addAttributes>
-        <att name="_NCProperties">null</att>
-        <att name="cdm_data_type">Point</att>
-        <att name="infoUrl">{info_url}</att>                
-        <att name="sourceUrl">(local files)</att>
-        <att name="standard_name_vocabulary">CF Standard Name Table v70</att>
-        <att name="subsetVariables">{subset_vars_str}</att> 
-    </addAttributes>        
-</dataset>
-    """
-    tree = etree.ElementTree(etree.fromstring(x))
-    root = tree.getroot()
+    # Copy the dataset skeleton and fill the dataset-specific values
+    root = copy.deepcopy(_dataset_template)
+    root.attrib["datasetID"] = str(dataset_id)
+    root.find("fileDir").text = str(directory)
+    root.find("addAttributes/att[@name='infoUrl']").text = info_url
+    root.find("addAttributes/att[@name='subsetVariables']").text = subset_vars_str
+    tree = etree.ElementTree(root)
 
     for source, dest in erddap_dims.items():  # already in lowercase
-        datatype = "float"
-        attrs = {}
-        if dest == "time":
-            datatype = "double"
-            attrs = {
-                "units": "seconds since 1970-01-01",
-                "time_precision": "1970-01-01T00:00:00Z"
-            }
-        elif dest == "depth":
-            attrs = {
-                "units": "m",
-            }
-        elif dest == "sensor_id":
-            datatype = "String"
+        datatype, attrs = _erddap_dimension_types.get(dest, ("float", {}))
         add_variable(root, source, dest, datatype, attributes=attrs)
 
     # Process all data variables
-    for v in get_variables(wf):
+    for v in variables:
         add_variable(root, v, v, "float", attributes={})
 
     for source, dest in erddap_qc.items():
         add_variable(root, source, dest, "byte", attributes={})
-    etree.indent(root, space="    ", level=0)  # force indentation
 
     return serialize(tree)
 
@@ -126,8 +158,8 @@ def read_xml(filename):
 
 
 def serialize(tree):
-    etree.indent(tree, space="  ", level=0)
-    return etree.tostring(tree, encoding="unicode", pretty_print=True, xml_declaration=False)
+    etree.indent(tree, space="  ", level=0)  # indent already sets the whitespace, no need to pretty print again
+    return etree.tostring(tree, encoding="unicode", pretty_print=False, xml_declaration=False) + "\n"
 
 
 def prettyprint_xml(x):
@@ -142,17 +174,15 @@ def add_variable(root, source, destination, datatype, attributes: dict = {}):
     """
     Adds a variable to an ERDDAP dataset
     """
-
-    __valid_data_types = ["int", "byte", "double", "float", "String"]
-
-    if datatype not in __valid_data_types:
+    if datatype not in _valid_data_types:
         raise ValueError(f"Data type '{datatype}' not valid!")
 
-    var = etree.SubElement(root, "dataVariable")
-    etree.SubElement(var, "sourceName").text = source
-    etree.SubElement(var, "destinationName").text = destination
-    etree.SubElement(var, "dataType").text = datatype
-    attrs = etree.SubElement(var, "addAttributes")
+    var = copy.deepcopy(_data_variable_template)
+    source_name, destination_name, data_type, attrs = var
+    source_name.text = source
+    destination_name.text = destination
+    data_type.text = datatype
+    root.append(var)
     for key, value in attributes.items():
         att = etree.SubElement(attrs, "att")
         att.attrib["name"] = key
@@ -163,56 +193,91 @@ def backup_datsets_file(filename):
     """
     Generates a .datasets.xml.YYYMMDD_HHMMSS backup file of the datasets.xml
     """
-    assert type(filename) is str, f"expected string, got {type(filename)}"
+    assert isinstance(filename, str), f"expected string, got {type(filename)}"
     basename = os.path.basename(filename)
     directory = os.path.dirname(filename)
     backup = "." + basename + "." + datetime.now().strftime("%Y%m%d_%H%M%S")
     backup = os.path.join(directory, backup)
-    shutil.copy2(filename, backup)
+    try:
+        # add_dataset replaces datasets.xml with a new file, so a hard link keeps the previous contents
+        os.link(filename, backup)
+    except OSError:  # hard links not supported by the filesystem
+        shutil.copy2(filename, backup)
     return backup
 
 
+def __serialize_top_level(elem) -> bytes:
+    """
+    Serializes an element (or comment) directly under the datasets.xml root, indented as lxml's pretty_print would do
+    """
+    if isinstance(elem.tag, str):  # comments have no children to indent
+        etree.indent(elem, space="  ", level=1)
+    return b"  " + etree.tostring(elem, encoding="UTF-8", with_tail=False) + b"\n"
+
+
 def add_dataset(filename: str, dataset: str):
     """
-    Adds a dataset to an exsiting ERDDAP deployment by modifying the datasets.xml config file
+    Adds a dataset to an exsiting ERDDAP deployment by modifying the datasets.xml config file. The file is streamed
+    element by element into a temporary file which then replaces the original, so the full datasets.xml is never held
+    in memory
     :param filename: path to datasets.xml file
     :param dataset: string containing the XML configuration for the dataset
     """
 
-    assert type(filename) is str, f"expected string, got {type(filename)}"
-    assert type(dataset) is str, f"expected string, got {type(dataset)}"
+    assert isinstance(filename, str), f"expected string, got {type(filename)}"
+    assert isinstance(dataset, str), f"expected string, got {type(dataset)}"
 
     bckp = backup_datsets_file(filename)
-    dataset_tree = etree.ElementTree(etree.fromstring(dataset))
-    dataset_root = dataset_tree.getroot()
+    dataset_root = etree.fromstring(dataset, etree.XMLParser(remove_blank_text=True))
     dataset_id = dataset_root.attrib["datasetID"]
 
-    parser = etree.XMLParser(remove_blank_text=True)
-    tree = etree.parse(filename, parser)  # load from template
-    root = tree.getroot()
-
-    try:
-        e = get_element(root, "dataset", attr="datasetID", attr_value=dataset_id)
-        rich.print(f"[yellow]Overwriting existing dataset {dataset_id}!")
-        e.getparent().remove(e)  # Remove the old dataset
-    except LookupError:
-        pass
-
-    root.append(dataset_root)
-    with open(filename, "w") as f:
-        xml = etree.tostring(tree, encoding="UTF-8", pretty_print=True, xml_declaration=True)
-        s = xml.decode()
-        f.write(s)
-
-
-
-
-
-
-
-
-
-
-
-
-
+    directory = os.path.dirname(os.path.abspath(filename))
+    with tempfile.NamedTemporaryFile("wb", dir=directory, prefix=".datasets.xml.", delete=False) as f:
+        try:
+            f.write(b"<?xml version='1.0' encoding='UTF-8'?>\n")
+            root_tag = None
+            after_root = []  # comments and processing instructions after the root, written after its closing tag
+            depth = 0
+            context = etree.iterparse(filename, events=("start", "end", "comment", "pi"), remove_blank_text=True)
+            for event, elem in context:
+                if event == "start":
+                    depth += 1
+                    if depth == 1:  # open the root element, keeping its attributes
+                        root_tag = etree.tostring(etree.Element(elem.tag, elem.attrib, nsmap=elem.nsmap))
+                        f.write(root_tag[:-2] + b">\n")
+                    continue
+
+                if event in ("comment", "pi"):
+                    if depth == 0 and root_tag is None:  # before the root element
+                        f.write(etree.tostring(elem, encoding="UTF-8", with_tail=False) + b"\n")
+                    elif depth == 0:  # after the root element
+                        after_root.append(etree.tostring(elem, encoding="UTF-8", with_tail=False) + b"\n")
+                    elif depth == 1:
+                        f.write(__serialize_top_level(elem))
+                    continue
+
+                depth -= 1  # end event
+                if depth != 1:
+                    continue  # nested element, or the root itself, nothing to do
+
+                if elem.tag == "dataset" and elem.attrib.get("datasetID") == dataset_id:
+                    rich.print(f"[yellow]Overwriting existing dataset {dataset_id}!")  # Skip the old dataset
+                else:
+                    f.write(__serialize_top_level(elem))
+
+                # Free the already written elements
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+            f.write(__serialize_top_level(dataset_root))
+            # the root tag name as serialized in the start tag (including its prefix, if any)
+            root_name = root_tag[1:].split(b"/>")[0].split()[0]
+            f.write(b"</" + root_name + b">\n")
+            f.writelines(after_root)
+        except Exception:
+            os.remove(f.name)
+            raise
+
+    shutil.copymode(filename, f.name)
+    os.replace(f.name, filename)
@@ -9,7 +9,6 @@ license: MIT
 created: 1/3/23
 """
 
-import requests
 import rich
 import json
 
@@ -31,6 +30,7 @@ class ERDDAP:
 
     @staticmethod
     def get(url,  headers={"Content-Type": "application/json"}):
+        import requests  # imported here, as it is quite slow to import and only needed to query ERDDAP
         r = requests.get(url, headers=headers)
         if r.status_code != 200:
             rich.print(f"[red]HTTP Error: {r.status_code}")
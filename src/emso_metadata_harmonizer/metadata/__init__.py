@@ -1,2 +1,2 @@
 #!/usr/bin/env python3
-from .emso import EmsoMetadata
+from .emso import EmsoMetadata, get_emso_metadata
@@ -12,7 +12,7 @@ created: 29/4/23
 from argparse import ArgumentParser
 import json
 import rich
-from . import EmsoMetadata
+from . import EmsoMetadata, get_emso_metadata
 from .constants import dimensions, iso_time_format
 from .dataset import get_variables, set_multisensor
 from .metadata_templates import choose_interactively, dimension_metadata, quality_control_metadata
@@ -249,7 +249,7 @@ def autofill_waterframe(wf):
     """
     Takes a waterframe and tries to autofill it
     """
-    emso = EmsoMetadata()
+    emso = get_emso_metadata()
     variables = get_variables(wf)
 
     wf = autofill_coordinates(wf)  # fill the coordinates
@@ -8,6 +8,7 @@ license: MIT
 created: 29/4/23
 """
 import logging
+import os
 
 from .waterframe import WaterFrame
 import pandas as pd
@@ -18,40 +19,57 @@ import netCDF4 as nc
 
 from .metadata_templates import dimension_metadata, quality_control_metadata
 from .netcdf import wf_to_multidim_nc, read_nc
-from .utils import drop_duplicates, merge_dicts
+from .utils import merge_dicts
+
+
+# CF encoding attributes, xarray decodes them when loading data, so they are not part of the variable metadata
+_cf_encoding_attributes = ("_FillValue", "missing_value", "scale_factor", "add_offset", "coordinates", "_Unsigned")
+
+# NetCDF time units converted with vectorized arithmetic, mapped to microseconds per unit
+_nc_time_units = {
+    "seconds": 1_000_000, "second": 1_000_000, "secs": 1_000_000, "sec": 1_000_000, "s": 1_000_000,
+    "minutes": 60_000_000, "minute": 60_000_000, "mins": 60_000_000, "min": 60_000_000,
+    "hours": 3_600_000_000, "hour": 3_600_000_000, "hrs": 3_600_000_000, "hr": 3_600_000_000, "h": 3_600_000_000,
+    "days": 86_400_000_000, "day": 86_400_000_000, "d": 86_400_000_000
+}
+_max_timedelta_us = pd.Timedelta.max.value // 1000
+_gregorian_reform = pd.Timestamp("1582-10-15", tz="UTC")
 
 
 def get_variables(wf):
     """
     returns a list of QC variables within a waterframe
     """
-    vars = []
-    dimensions_l = [d.lower() for d in dimensions]
-    for c in wf.data.columns:
-        if not c.endswith("_QC") and not c.endswith("_STD") and c.lower() not in dimensions and c.lower() not in dimensions_l:
-            vars.append(c)
-    return vars
+    columns = wf.data.columns
+    names = columns.astype(str)
+    is_qc = names.str.endswith("_QC")
+    is_std = names.str.endswith("_STD")
+    is_dim = names.str.lower().isin([d.lower() for d in dimensions])  # dimensions may change, don't cache them
+    return columns[~(is_qc | is_std | is_dim)].tolist()
 
 
 def get_dimensions(wf):
     """
     returns a list of QC variables within a waterframe
     """
-    return [col for col in wf.data.columns if col.upper() in dimensions]
+    columns = wf.data.columns
+    return columns[columns.astype(str).str.upper().isin(dimensions)].tolist()
 
 
 def get_qc_variables(wf):
     """
     returns a list of QC variables within a waterframe
     """
-    return [col for col in wf.data.columns if col.endswith("_QC")]
+    columns = wf.data.columns
+    return columns[columns.astype(str).str.endswith("_QC")].tolist()
 
 
 def get_std_variables(wf):
     """
     returns a list of standard deviation variables within a waterframe
     """
-    return [col for col in wf.data.columns if col.endswith("_STD")]
+    columns = wf.data.columns
+    return columns[columns.astype(str).str.endswith("_STD")].tolist()
 
 
 def harmonize_dataframe(df, fill_value=fill_value):
@@ -65,23 +83,23 @@ def harmonize_dataframe(df, fill_value=fill_value):
             if key.lower() == time_key:
                 df = df.rename(columns={key: "TIME"})
 
+    # Build all the new column names first and rename only once, renaming column by column copies the dataframe
+    new_names = {}
     for var in df.columns:
-        skip = False
-        for dim in dimensions:  # skip all dimensions and QC related to dimensions
-            if var.startswith(dim):
-                skip = True
-        if not skip:
-            df = df.rename(columns={var: var.upper()})
-
-    # make sure that _QC are uppercase
-    for var in df.columns:
-        if var.lower().endswith("_qc"):
-            df = df.rename(columns={var: var[:-3] + "_QC"})
+        name = var
+        # skip all dimensions and QC related to dimensions
+        if not any(var.startswith(dim) for dim in dimensions):
+            name = name.upper()
 
-    # make sure that _QC are uppercase
-    for var in df.columns:
-        if var.lower().endswith("_std"):
-            df = df.rename(columns={var: var[:-4] + "_STD"})
+        # make sure that _QC are uppercase
+        if name.lower().endswith("_qc"):
+            name = name[:-3] + "_QC"
+
+        # make sure that _STD are uppercase
+        elif name.lower().endswith("_std"):
+            name = name[:-4] + "_STD"
+        new_names[var] = name
+    df = df.rename(columns=new_names)
 
     missing_data = qc_flags["missing_value"]
     for col in df.columns:
@@ -122,33 +140,47 @@ def df_to_wf(df: pd.DataFrame) -> WaterFrame:
     df = harmonize_dataframe(df)
     vocabulary = {c: {} for c in df.columns}
     wf = WaterFrame(df, {}, vocabulary)
-    wf.data["TIME"] = pd.to_datetime(wf.data["TIME"])
+    if not pd.api.types.is_datetime64_any_dtype(wf.data["TIME"]):  # avoid re-parsing already converted times
+        wf.data["TIME"] = pd.to_datetime(wf.data["TIME"])
     return wf
 
 
 
 
-def csv_detect_header(filename, separator=","):
+def csv_detect_header(filename, separator=",", tail_size=65536):
     """
     Opens a CSV, reads the last 3 lines and extracts the number of fields. Then it goes back to the beginning and
-    detects the first line which is not a header
-    """
-    with open(filename) as f:
-        lines = f.readlines()
+    detects the first line which is not a header. Only the tail and the header of the file are read.
+    :param filename: CSV file
+    :param separator: field separator
+    :param tail_size: bytes read from the end of the file to get the last lines
+    :returns: number of header lines
+    """
+    sep = separator.encode()
+    with open(filename, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        f.seek(max(0, size - tail_size))
+        lines = f.read().splitlines()
+        if size > tail_size:
+            lines = lines[1:]  # first line is most likely truncated
+            if len(lines) < 4:  # extremely long lines, fallback to reading the whole file
+                f.seek(0)
+                lines = f.read().splitlines()
 
     if len(lines) < 3:
         # empty CSV, first line is the header
         return 0
 
-    nfields = len(lines[-2].split(separator))
-    if nfields < 2 or not (nfields == len(lines[-3].split(separator)) == len(lines[-4].split(separator))):
+    nfields = lines[-2].count(sep) + 1
+    if nfields < 2 or not (nfields == lines[-3].count(sep) + 1 == lines[-4].count(sep) + 1):
         raise ValueError("Could not determine number of fields")
 
     # loop until a first a line with nfields is found
-    i = 0
-    while len(lines[i].split(separator)) != nfields:
-        i += 1
-    return i
+    with open(filename) as f:
+        for i, line in enumerate(f):
+            if line.count(separator) + 1 == nfields:
+                return i
+    raise ValueError("Could not determine number of fields")
 
 
 def wf_force_upper_case(wf: WaterFrame) -> WaterFrame:
@@ -186,25 +218,54 @@ def semicolon_to_list(attr: str):
     """
     Converts semi-colon separated list of items into a python list
     """
-    if type(attr) == str and ";" in attr:
+    if isinstance(attr, str) and ";" in attr:
         return attr.split(";")
-    else:
-        return attr
+    return attr
 
 
 # -------- Load NetCDF data -------- #
+def nc_times_to_datetime(values, units: str):
+    """
+    Converts numeric NetCDF times (e.g. "seconds since 1970-01-01") into UTC timestamps. The conversion is done with
+    vectorized numpy arithmetic, falling back to netCDF4's num2date for units or reference dates it can't handle.
+    Like num2date, times are rounded to microseconds after scaling them with long double precision, so the results
+    are identical. NaN times are converted to NaT.
+    :param values: array of numeric times
+    :param units: CF time units
+    :returns: UTC DatetimeIndex
+    """
+    unit, _, epoch = units.strip().partition(" since ")
+    unit = unit.strip().lower()
+    if unit in _nc_time_units:
+        try:
+            epoch = pd.Timestamp(epoch.strip())
+            epoch = epoch.tz_convert("UTC") if epoch.tzinfo else epoch.tz_localize("UTC")
+            # num2date uses the mixed julian/gregorian calendar, only identical after the gregorian reform
+            if epoch >= _gregorian_reform:
+                # same arithmetic as num2date: scale to microseconds in long double and round to the nearest
+                microseconds = np.round(np.asarray(values, dtype=np.longdouble) * _nc_time_units[unit])
+                valid = np.isfinite(microseconds)
+                if np.any(np.abs(microseconds[valid]) > _max_timedelta_us):
+                    raise ValueError("times out of bounds")
+                microseconds = np.where(valid, microseconds, 0).astype(np.int64)
+                times = epoch + pd.to_timedelta(microseconds, unit="us")
+                return times.where(valid)
+        except ValueError:
+            pass  # unparseable reference date or times out of bounds, use num2date
+
+    times = nc.num2date(values, units, only_use_python_datetimes=True, only_use_cftime_datetimes=False)
+    return pd.to_datetime(times, utc=True)
+
+
 def load_nc_data(filename, drop_duplicates=False, process_lists=True) -> (WaterFrame, list):
     """
     Loads NetCDF data into a waterframe
     """
     wf = read_nc(filename, decode_times=False)
     if process_lists:  # Process semicolon separated lists
-        for key, value in wf.metadata.items():
-            wf.metadata[key] = semicolon_to_list(value)
-
-        for var in wf.vocabulary.keys():
-            for key, value in wf.vocabulary[var].items():
-                wf.vocabulary[var][key] = semicolon_to_list(value)
+        wf.metadata = {key: semicolon_to_list(value) for key, value in wf.metadata.items()}
+        wf.vocabulary = {var: {key: semicolon_to_list(value) for key, value in varmeta.items()}
+                         for var, varmeta in wf.vocabulary.items()}
     wf.data = wf.data.reset_index()
 
     if "row" in wf.data.columns:
@@ -218,13 +279,14 @@ def load_nc_data(filename, drop_duplicates=False, process_lists=True) -> (WaterF
             units = "days since 1950-01-01T00:00:00z"
         else:
             units = "seconds since 1970-01-01T00:00:00z"
-    df["TIME"] = nc.num2date(df["TIME"].values, units, only_use_python_datetimes=True, only_use_cftime_datetimes=False)
-    df["TIME"] = pd.to_datetime((df["TIME"]), utc=True)
+    df["TIME"] = nc_times_to_datetime(df["TIME"].values, units)
     if drop_duplicates:
-        dups = df[df["TIME"].duplicated()]
-        if len(dups) > 0:
-            rich.print(f"[yellow]WARNING! detected {len(dups)} duplicated times!, deleting")
-            df = drop_duplicates(df)
+        # A single hash pass over the dimensions, in single-position timeseries this is the same as duplicated times
+        duplicated = df.duplicated(subset=[col for col in df.columns if col in dimensions])
+        n = int(duplicated.sum())
+        if n > 0:
+            rich.print(f"[yellow]WARNING! detected {n} duplicated rows (same dimension values)!, deleting")
+            df = df.loc[~duplicated].reset_index(drop=True)
 
     wf.data = df  # assign data
     wf.metadata["$datafile"] = filename  # Add the filename as a special param
@@ -412,13 +474,29 @@ def extract_netcdf_metadata(wf):
 
 def get_netcdf_metadata(filename):
     """
-    Returns the metadata from a NetCDF file
+    Returns the metadata from a NetCDF file. Only the attributes are read, data is never loaded
     :param: filename
     :returns: dict with the metadata { "global": ..., "variables": {"VAR1": {...},"VAR2":{...}}
     """
-    wf = load_nc_data(filename, process_lists=False)
+    with nc.Dataset(filename, "r") as ds:
+        metadata = {key: ds.getncattr(key) for key in ds.ncattrs()}
+        vocabulary = {}
+        for varname, var in ds.variables.items():
+            vocabulary[varname] = {key: var.getncattr(key) for key in var.ncattrs()
+                                   if key not in _cf_encoding_attributes}
+        # dimensions without a variable still end up as columns when loading the data (except for row)
+        for dimname in ds.dimensions:
+            if dimname not in vocabulary and dimname != "row":
+                vocabulary[dimname] = {}
+
+    # Force upper case in dimensions, as load_nc_data does
+    for key in list(vocabulary):
+        if key.upper() in dimensions and key.upper() != key:
+            vocabulary[key.upper()] = vocabulary.pop(key)
+
+    metadata["$datafile"] = filename
     metadata = {
-        "global": wf.metadata,
-        "variables": wf.vocabulary
+        "global": metadata,
+        "variables": vocabulary
     }
-    return metadata
\ No newline at end of file
+    return metadata
@@ -9,13 +9,18 @@ email: enoc.martinez@upc.edu
 license: MIT
 created: 3/3/23
 """
+import concurrent.futures as futures
+import csv
+import functools
+import io
+import itertools
 import os
-import ssl
+import pickle
 import rich
 import pandas as pd
-import json
+import threading
 import time
-from .utils import download_files, get_file_list
+from .utils import download_files, get_file_list, load_json_file, dump_json_file, threadify, iter_json_items
 
 emso_version = "develop"
 
@@ -34,14 +39,49 @@ sdn_vocab_l22 = "https://vocab.nerc.ac.uk/collection/L22/current/?_profile=nvs&_
 sdn_vocab_l35 = "https://vocab.nerc.ac.uk/collection/L35/current/?_profile=nvs&_mediatype=application/ld+json"
 # standard_names = "https://vocab.nerc.ac.uk/standard_name/?_profile=nvs&_mediatype=application/ld+json"
 
-edmo_codes = "https://edmo.seadatanet.org/sparql/sparql?query=SELECT%20%3Fs%20%3Fp%20%3Fo%20WHERE%20%7B%20%0D%0A%0" \
-             "9%3Fs%20%3Fp%20%3Fo%20%0D%0A%7D%20LIMIT%201000000&accept=application%2Fjson"
+# SELECT ?s ?o WHERE { ?s <http://www.w3.org/ns/org#name> ?o }, only the name of every organization is requested
+edmo_codes = "https://edmo.seadatanet.org/sparql/sparql?query=SELECT%20%3Fs%20%3Fo%20WHERE%20%7B%20%3Fs%20%3Chttp%3A%2F%2F" \
+             "www.w3.org%2Fns%2Forg%23name%3E%20%3Fo%20%7D&accept=application%2Fjson"
 
 spdx_licenses_github = "https://raw.githubusercontent.com/spdx/license-list-data/main/licenses.md"
 
 # Copernicus INS TAC Parameter list v3.2
 copernicus_param_list = "https://archimer.ifremer.fr/doc/00422/53381/108480.xlsx"
 
+# Columns stored in the SDN vocab CSV files, all of them text
+_sdn_vocab_columns = ["id", "uri", "prefLabel", "definition"]
+
+# Columns and types of the EDMO codes CSV file
+_edmo_dtypes = {"uri": str, "code": int, "name": str}
+
+
+def __markdown_table_to_dataframe(headers: list, rows: list) -> pd.DataFrame:
+    """
+    Parses the rows of a Markdown table with pandas' C parser. Values are stripped and true/false strings are converted
+    to booleans
+    :param headers: list of column names
+    :param rows: list of table lines, like '| value 1 | value 2 |'
+    :returns: DataFrame with the table
+    """
+    if not rows:
+        return pd.DataFrame({header: [] for header in headers})
+
+    # Each row starts and ends with '|', so the first and last columns are always empty
+    df = pd.read_csv(io.StringIO("\n".join(rows)), sep="|", header=None, dtype=str, engine="c",
+                     quoting=csv.QUOTE_NONE, keep_default_na=False, skip_blank_lines=False)
+    df = df.iloc[:, 1:-1]
+    df.columns = headers
+    for header in headers:
+        values = df[header].str.strip()
+        is_true = values.isin(("true", "True"))
+        is_false = values.isin(("false", "False"))
+        if is_true.any() or is_false.any():
+            values = values.astype(object).mask(is_true, True).mask(is_false, False)
+            if (is_true | is_false).all():
+                values = values.astype(bool)
+        df[header] = values
+    return df
+
 
 def process_markdown_file(file) -> (dict, dict):
     """
@@ -54,93 +94,98 @@ def process_markdown_file(file) -> (dict, dict):
     title = ""
     tables = {}
     in_table = False
-    lines += "\n"  # add an empty line to force table end
-    linenum = 0
     for line in lines:
         line = line.strip()
-        linenum += 1
         if line.startswith("#"):  # store the title
             title = line.strip().replace("#", "").strip()
 
         elif not in_table and line.startswith("|"):  # header of the table
             if not line.endswith("|"):
                 line += "|"  # fix tables not properly formatted
-            table = {}
             headers = line.strip().split("|")
             headers = [h.strip() for h in headers][1:-1]
-
-            for header in headers:
-                table[header] = []
-
+            rows = []
             in_table = True
 
         elif in_table and not line.startswith("|"):  # end of the table
             in_table = False
-            tables[title] = pd.DataFrame(table)  # store the metadata as a DataFrame
+            tables[title] = __markdown_table_to_dataframe(headers, rows)  # store the metadata as a DataFrame
 
         elif line.startswith("|---"):  # skip the title and body separator (|----|---|---|)
             continue
 
-        elif line.startswith("|"):  # process the row
+        elif line.startswith("|"):  # store the row, all rows are parsed at once at the end of the table
             if not line.endswith("|"):
                 line += "|"  # fix tables not properly formatted
-            fields = [f.strip() for f in line.split("|")[1:-1]]
-            for i in range(len(fields)):
-                if fields[i] in ["false", "False"]:
-                    table[headers[i]].append(False)
-                elif fields[i] in ["true", "True"]:
-                    table[headers[i]].append(True)
-                else:
-                    table[headers[i]].append(fields[i])
+            rows.append(line)
+
+    if in_table:  # the file ends with a table
+        tables[title] = __markdown_table_to_dataframe(headers, rows)
+    return tables
+
+
+def load_markdown_tables(file) -> dict:
+    """
+    Same as process_markdown_file, but the parsed tables are cached in a <file>.pkl file. The cache is only used while
+    the Markdown file has the same modification time and size, otherwise the file is parsed again.
+    :returns: a dict wher keys are table titles and values are dataframes with the info
+    """
+    cache_file = file + ".pkl"
+    stat = os.stat(file)
+    key = (stat.st_mtime_ns, stat.st_size)
+    if os.path.isfile(cache_file):
+        try:
+            with open(cache_file, "rb") as f:
+                cached = pickle.load(f)
+            if cached["key"] == key:
+                return cached["tables"]
+        except Exception as e:  # corrupted or incompatible cache, just parse the file again
+            rich.print(f"[yellow]Ignoring Markdown cache {cache_file}: {e}")
+
+    tables = process_markdown_file(file)
+    with open(cache_file, "wb") as f:
+        pickle.dump({"key": key, "tables": tables}, f, protocol=pickle.HIGHEST_PROTOCOL)
     return tables
 
 
 def get_sdn_jsonld_ids(file):
-    with open(file, encoding="utf-8") as f:
-        data = json.load(f)
     ids = []
-    for element in data["@graph"]:
+    for element in iter_json_items(file, "@graph"):
         if "identifier" in element.keys():
             ids.append(element["identifier"])
     return ids
 
 
 def get_sdn_jsonld_pref_label(file):
-    with open(file, encoding="utf-8") as f:
-        data = json.load(f)
-
     names = []
-    for element in data["@graph"][1:]:
+    for element in itertools.islice(iter_json_items(file, "@graph"), 1, None):
         if "prefLabel" in element.keys() and "@value" in element["prefLabel"].keys():
             names.append(element["prefLabel"]["@value"])
     return names
 
 
 def get_sdn_jsonld_uri(file):
-    with open(file, encoding="utf-8") as f:
-        data = json.load(f)
-
     names = []
-    for element in data["@graph"][1:]:
+    for element in itertools.islice(iter_json_items(file, "@graph"), 1, None):
         if "@id" in element.keys():
             names.append(element["@id"])
     return names
 
 
 def get_edmo_codes(file):
-    with open(file, encoding="utf-8") as f:
-        data = json.load(f)
+    data = load_json_file(file)  # the SPARQL results are large, decoded with orjson if available
 
     codes = []
     uris = []
     names = []
     for element in data["results"]["bindings"]:
-        if element["p"]["value"] == "http://www.w3.org/ns/org#name":
-
-            code = int(element["s"]["value"].split("/")[-1])
-            uris.append(element["s"]["value"])
-            codes.append(code)
-            names.append(element["o"]["value"])
+        # Files downloaded with the former ?s ?p ?o query also have other predicates, keep only the names
+        if "p" in element and element["p"]["value"] != "http://www.w3.org/ns/org#name":
+            continue
+        code = int(element["s"]["value"].split("/")[-1])
+        uris.append(element["s"]["value"])
+        codes.append(code)
+        names.append(element["o"]["value"])
 
     df = pd.DataFrame({
         "uri": uris,
@@ -149,15 +194,61 @@ def get_edmo_codes(file):
     })
     return df
 
+def _harmonize_uri(uri):
+    """
+    Takes a SDN URI and make sure that uses http instead of https and that it finishes with a /
+    """
+    if uri.startswith("https"):
+        uri = uri.replace("https", "http")
+
+    if not uri.endswith("/"):
+        uri += "/"
+    return uri
+
+
+def build_index(values) -> dict:
+    """
+    Builds a dict that maps each value to the position where it first appears, to avoid scanning the values on every
+    lookup
+    :param values: iterable with the values to index
+    :returns: dict {value: position}
+    """
+    index = {}
+    for i, value in enumerate(values):
+        index.setdefault(value, i)
+    return index
+
+
+# Converts the value of a SKOS relation (narrower, broader, related) to a list of URIs, depending on its JSON type
+_sdn_relation_parsers = {
+    dict: lambda value: [value["@id"]],
+    list: lambda value: [v["@id"] if isinstance(v, dict) else v for v in value],
+    str: lambda value: [value],
+}
+
+
+def _extract_related_elements(element: dict, keys: list) -> list:
+    """
+    Returns the list of URIs related to a JSON-LD concept through the first key found
+    :param element: JSON-LD concept
+    :param keys: keys of the relation, e.g. ["skos:broader", "broader"]
+    :returns: list of URIs, empty if none of the keys is present
+    """
+    for key in keys:
+        if key in element:
+            value = element[key]
+            if type(value) not in _sdn_relation_parsers:
+                raise ValueError(f"Type {type(value)} not expected")
+            return _sdn_relation_parsers[type(value)](value)
+    return []
+
+
 def parse_sdn_jsonld(filename):
     """
     Opens a JSON-LD file from SeaDataNet and try to process it.
     :param filename: file path
     :returns: data (dict), narrower (list), broader (list), related (list)
     """
-    with open(filename, encoding="utf-8") as f:
-        contents = json.load(f)
-
     data = {
         "uri": [],
         "identifier": [],
@@ -172,62 +263,35 @@ def parse_sdn_jsonld(filename):
         "uri": ["@id"]
     }
 
-    def get_value_by_alias(mydict, mykey):
-        if mykey not in alias.keys():
-            return mydict[mykey]
-        for try_alias in alias[mykey]:
-            try:
+    def get_value_by_alias(mydict, aliases):
+        for try_alias in aliases:
+            if try_alias in mydict:
                 return mydict[try_alias]
-            except KeyError:
-                pass
         return None
 
+    # Pairs of (data list, aliases) resolved once instead of looking up the alias dict for every concept
+    columns = [(data[key], alias[key]) for key in data]
+
     narrower = {}
     broader = {}
     related = {}
-    for element in contents["@graph"]:
-        uri = element["@id"]
+    for element in iter_json_items(filename, "@graph"):  # concepts are decoded one by one to keep memory low
         if element["@type"] != "skos:Concept":
             continue
+        uri = element["@id"]
 
-        for key in data.keys():
-            value = get_value_by_alias(element, key)
-            if type(value) == type(None):
-                # Check that it is explicitly NoneType
+        for values, aliases in columns:
+            value = get_value_by_alias(element, aliases)
+            if value is None:
                 continue
             if type(value) is dict:
                 value = value["@value"]
-            data[key].append(value)
-
-        # Initialize as empty list
-        narrower[uri] = []
-        broader[uri] = []
-        related[uri] = []
-
-        def extract_related_elements(mydict, mykeys):
-            for mykey in mykeys:
-                if mykey not in mydict.keys():
-                    continue
-                if isinstance(mydict[mykey], dict):
-                    return [mydict[mykey]["@id"]]  # generate a dict with the dict value
-                elif isinstance(mydict[mykey], list):
-                    newlist = []
-                    for nested_value in mydict[mykey]:
-                        if isinstance(nested_value, dict):
-                            newlist.append(nested_value["@id"])
-                        else:
-                            newlist.append(nested_value)
-                    return newlist
-                elif isinstance(mydict[mykey], str):
-                    return [mydict[mykey]]  # generate a list with the string
-                else:
-                    raise ValueError(f"Type {type(mydict[mykey])} not expected")
-            return []
+            values.append(value)
 
         # If present, store relationships
-        narrower[uri] = extract_related_elements(element, ["skos:narrower", "narrower"])
-        broader[uri] = extract_related_elements(element, ["skos:broader", "broader"])
-        related[uri] = extract_related_elements(element, ["skos:related", "related"])
+        narrower[uri] = _extract_related_elements(element, ["skos:narrower", "narrower"])
+        broader[uri] = _extract_related_elements(element, ["skos:broader", "broader"])
+        related[uri] = _extract_related_elements(element, ["skos:related", "related"])
 
     # Remove prefixes like skos and dce
     prefixes = ["skos:", "dce:", "dc:"]
@@ -248,25 +312,26 @@ def parse_sdn_jsonld(filename):
 class EmsoMetadata:
     def __init__(self, force_update=False):
 
-        os.makedirs(".emso", exist_ok=True)  # create a conf dir to store Markdown and other stuff
-        os.makedirs(os.path.join(".emso", "jsonld"), exist_ok=True)
-        os.makedirs(os.path.join(".emso", "relations"), exist_ok=True)
-        ssl._create_default_https_context = ssl._create_unverified_context
-
-        emso_metadata_file = os.path.join(".emso", "EMSO_metadata.md")
-        oceansites_file = os.path.join(".emso", "OceanSites_codes.md")
-        emso_sites_file = os.path.join(".emso", "EMSO_codes.md")
-        sdn_vocab_p01_file = os.path.join(".emso", "jsonld", "sdn_vocab_p01.json")
-        sdn_vocab_p02_file = os.path.join(".emso", "jsonld", "sdn_vocab_p02.json")
-        sdn_vocab_p06_file = os.path.join(".emso", "jsonld", "sdn_vocab_p06.json")
-        sdn_vocab_p07_file = os.path.join(".emso", "jsonld", "sdn_vocab_p07.json")
-        sdn_vocab_l05_file = os.path.join(".emso", "jsonld", "sdn_vocab_l05.json")
-        sdn_vocab_l06_file = os.path.join(".emso", "jsonld", "sdn_vocab_l06.json")
-        sdn_vocab_l22_file = os.path.join(".emso", "jsonld", "sdn_vocab_l22.json")
-        sdn_vocab_l35_file = os.path.join(".emso", "jsonld", "sdn_vocab_l35.json")
-        edmo_codes_jsonld = os.path.join(".emso", "edmo_codes.json")
-        spdx_licenses_file = os.path.join(".emso", "spdx_licenses.md")
-        copernicus_params_file = os.path.join(".emso", "copernicus_param_list.xlsx")
+        # Path to the conf dir resolved once, so the paths below do not depend on the working directory
+        emso_dir = os.path.abspath(".emso")
+        os.makedirs(emso_dir, exist_ok=True)  # create a conf dir to store Markdown and other stuff
+        os.makedirs(os.path.join(emso_dir, "jsonld"), exist_ok=True)
+        os.makedirs(os.path.join(emso_dir, "relations"), exist_ok=True)
+
+        emso_metadata_file = os.path.join(emso_dir, "EMSO_metadata.md")
+        oceansites_file = os.path.join(emso_dir, "OceanSites_codes.md")
+        emso_sites_file = os.path.join(emso_dir, "EMSO_codes.md")
+        sdn_vocab_p01_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_p01.json")
+        sdn_vocab_p02_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_p02.json")
+        sdn_vocab_p06_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_p06.json")
+        sdn_vocab_p07_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_p07.json")
+        sdn_vocab_l05_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_l05.json")
+        sdn_vocab_l06_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_l06.json")
+        sdn_vocab_l22_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_l22.json")
+        sdn_vocab_l35_file = os.path.join(emso_dir, "jsonld", "sdn_vocab_l35.json")
+        edmo_codes_jsonld = os.path.join(emso_dir, "edmo_codes.json")
+        spdx_licenses_file = os.path.join(emso_dir, "spdx_licenses.md")
+        copernicus_params_file = os.path.join(emso_dir, "copernicus_param_list.xlsx")
 
         tasks = [
             [emso_metadata_url, emso_metadata_file, "EMSO metadata"],
@@ -285,31 +350,44 @@ class EmsoMetadata:
             [copernicus_param_list, copernicus_params_file, "spdx licenses"]
         ]
 
-        download_files(tasks)
-
-        tables = process_markdown_file(emso_metadata_file)
-        self.global_attr = tables["Global Attributes"]
-        self.variable_attr = tables["Variable Attributes"]
-        self.dimension_attr = tables["Dimension Attributes"]
-        self.qc_attr = tables["Quality Control Attributes"]
-        self.technical_attr = tables["Technical Variables"]
-
-        tables = process_markdown_file(oceansites_file)
-        self.oceansites_sensor_mount = list(tables["Sensor Mount"]["sensor_mount"].values)
-        self.oceansites_sensor_orientation = list(tables["Sensor Orientation"]["sensor_orientation"].values)
-        self.oceansites_data_modes = list(tables["Data Modes"]["Value"].values)
-        self.oceansites_data_types = list(tables["Data Types"]["Data type"].values)
-
-        tables = process_markdown_file(emso_sites_file)
-        self.emso_regional_facilities = list(tables["EMSO Regional Facilities"]["EMSO Regional Facilities"].values)
-        self.emso_sites = list(tables["EMSO Sites"]["EMSO Site"].values)
-
-        tables = process_markdown_file(spdx_licenses_file)
-        t = tables["Licenses with Short Idenifiers"]
+        updated_files = download_files(tasks, force_download=force_update)
+
+        # If none of the downloaded files (nor this module) changed since the last run, restore the stored state
+        # instead of processing all the files again
+        state_file = os.path.join(emso_dir, f"emso_metadata_{emso_version}.pkl")
+        state_key = [emso_version] + [(f, os.stat(f).st_mtime_ns, os.stat(f).st_size) for f in [__file__] +
+                                      [task[1] for task in tasks]]
+        if self.__load_state(state_file, state_key):
+            return
+
+        # Markdown files are independent, so they are loaded concurrently
+        markdown_files = [emso_metadata_file, oceansites_file, emso_sites_file, spdx_licenses_file]
+        emso_tables, oceansites_tables, emso_sites_tables, spdx_tables = threadify(
+            [(file,) for file in markdown_files], load_markdown_tables, max_threads=len(markdown_files))
+
+        self.global_attr = emso_tables["Global Attributes"]
+        self.variable_attr = emso_tables["Variable Attributes"]
+        self.dimension_attr = emso_tables["Dimension Attributes"]
+        self.qc_attr = emso_tables["Quality Control Attributes"]
+        self.technical_attr = emso_tables["Technical Variables"]
+
+        self.oceansites_sensor_mount = oceansites_tables["Sensor Mount"]["sensor_mount"].tolist()
+        self.oceansites_sensor_orientation = oceansites_tables["Sensor Orientation"]["sensor_orientation"].tolist()
+        self.oceansites_data_modes = oceansites_tables["Data Modes"]["Value"].tolist()
+        self.oceansites_data_types = oceansites_tables["Data Types"]["Data type"].tolist()
+
+        facilities = emso_sites_tables["EMSO Regional Facilities"]
+        self.emso_regional_facilities = facilities["EMSO Regional Facilities"].tolist()
+        self.emso_sites = emso_sites_tables["EMSO Sites"]["EMSO Site"].tolist()
+
+        t = spdx_tables["Licenses with Short Idenifiers"]
         # remove extra '[' ']' in license identifiers
         new_ids = [value.replace("[", "").replace("]", "") for value in t["Short Identifier"]]
         self.spdx_license_names = new_ids
         self.spdx_license_uris = {lic: f"https://spdx.org/licenses/{lic}" for lic in self.spdx_license_names}
+        # sets for the compliance tests, which only check if a value is present
+        self.spdx_license_names_set = frozenset(self.spdx_license_names)
+        self.spdx_license_uris_set = frozenset(self.spdx_license_uris.values())
 
         sdn_vocabs = {
             "P01": sdn_vocab_p01_file,
@@ -329,49 +407,53 @@ class EmsoMetadata:
         self.sdn_vocabs_narrower = {}
         self.sdn_vocabs_broader = {}
         self.sdn_vocabs_related = {}
+        self.sdn_vocabs_uri_index = {}
+        self.sdn_vocabs_id_index = {}
+        self.sdn_vocabs_pref_label_set = {}  # sets to check if a value is in a vocab without scanning it
+        self.sdn_vocabs_uri_set = {}
+        # (vocab, relation, target vocab) -> {uri: related terms in target vocab}. Built lazily by get_relations, the
+        # first query of each combination scans the whole vocab. Never stored in the state cache
+        self.sdn_relations_by_target = {}
 
         t = time.time()
-        # Process raw SeaDataNet JSON-ld files and store them sliced in short JSON files
-        for vocab, jsonld_file in sdn_vocabs.items():
-            csv_filename = os.path.join(".emso", f"{vocab}.csv")
-            frelated = os.path.join(".emso", "relations",  f"{vocab}.related")
-            fnarrower = os.path.join(".emso", "relations",  f"{vocab}.narrower")
-            fbroader = os.path.join (".emso", "relations",  f"{vocab}.broader")
-            if os.path.exists(csv_filename):
-                df = pd.read_csv(csv_filename)
-                with open(frelated) as f:
-                    related = json.load(f)
-                with open(fnarrower) as f:
-                    narrower = json.load(f)
-                with open(fbroader) as f:
-                    broader = json.load(f)
-            else:
-                rich.print(f"Loading SDN {vocab}...", end="")
-                df, narrower, broader, related = self.load_sdn_vocab(jsonld_file)
-                rich.print("[green]done!")
-                for filename, values in {fnarrower: narrower, fbroader: broader, frelated: related}.items():
-                    with open(filename, "w") as f:
-                        json.dump(values, f)
-            # for vocab, df in self.sdn_vocabs.items():
-                # Storing to CSV to make it easier to search
-                df = df[["id", "uri", "prefLabel", "definition"]]
-                filename = os.path.join(".emso", f"{vocab}.csv")
-                df.to_csv(filename, index=False)
-
+        # Load all SDN vocabs concurrently, each one from its CSV and relations files or from the raw JSON-ld file
+        args = [(emso_dir, vocab, file, file in updated_files) for vocab, file in sdn_vocabs.items()]
+        # Processing raw JSON-ld files is CPU bound, so these vocabs are processed in separate processes
+        rebuild = [a for a in args if a[3] or not os.path.isfile(os.path.join(emso_dir, f"{a[1]}.csv"))]
+        cached = [a for a in args if a not in rebuild]
+        results = {}
+        if rebuild:
+            with futures.ProcessPoolExecutor(max_workers=min(len(rebuild), os.cpu_count())) as executor:
+                for a, result in zip(rebuild, executor.map(EmsoMetadata.load_cached_sdn_vocab, *zip(*rebuild))):
+                    results[a[1]] = result
+        if cached:
+            for a, result in zip(cached, threadify(cached, self.load_cached_sdn_vocab, max_threads=len(cached))):
+                results[a[1]] = result
+
+        for vocab in sdn_vocabs.keys():
+            df, narrower, broader, related = results[vocab]
             self.sdn_vocabs[vocab] = df
-            self.sdn_vocabs_narrower[vocab] = narrower
-            self.sdn_vocabs_broader[vocab] = broader
-            self.sdn_vocabs_related[vocab] = related
+            # Harmonize the stored URIs once, so lookups only need to harmonize the requested URI
+            self.sdn_vocabs_narrower[vocab] = {_harmonize_uri(uri): terms for uri, terms in narrower.items()}
+            self.sdn_vocabs_broader[vocab] = {_harmonize_uri(uri): terms for uri, terms in broader.items()}
+            self.sdn_vocabs_related[vocab] = {_harmonize_uri(uri): terms for uri, terms in related.items()}
             self.sdn_vocabs_pref_label[vocab] = df["prefLabel"].values
             self.sdn_vocabs_ids[vocab] = df["id"].values
             self.sdn_vocabs_uris[vocab] = df["uri"].values
-
-        edmo_csv = os.path.join(".emso", f"edmo_codes.csv")
-        if not os.path.exists(edmo_csv):
+            self.sdn_vocabs_uri_index[vocab] = build_index(_harmonize_uri(uri) if isinstance(uri, str) else uri
+                                                           for uri in df["uri"].values)
+            self.sdn_vocabs_id_index[vocab] = build_index(df["id"].values)
+            self.sdn_vocabs_pref_label_set[vocab] = frozenset(df["prefLabel"].values)
+            self.sdn_vocabs_uri_set[vocab] = frozenset(df["uri"].values)
+
+        edmo_csv = os.path.join(emso_dir, f"edmo_codes.csv")
+        if not os.path.exists(edmo_csv) or edmo_codes_jsonld in updated_files:
             self.edmo_codes = get_edmo_codes(edmo_codes_jsonld)
             self.edmo_codes.to_csv(edmo_csv, index=False)
         else:
-            self.edmo_codes = pd.read_csv(edmo_csv)
+            self.edmo_codes = pd.read_csv(edmo_csv, usecols=list(_edmo_dtypes.keys()), dtype=_edmo_dtypes, engine="c")
+        self.edmo_codes_set = frozenset(self.edmo_codes["code"].tolist())
+        self.edmo_uris_set = frozenset(self.edmo_codes["uri"].tolist())
 
         # TODO: Move hardcoded list to OceanSITES_codes.md
         self.oceansites_param_codes = ["AIRT", "CAPH", "CDIR", "CNDC", "CSPD", "DEPTH", "DEWT", "DOX2", "DOXY",
@@ -380,14 +462,56 @@ class EmsoMetadata:
                                        "UWND", "VAVH", "VAVT", "VCUR", "VDEN", "VDIR", "VWND", "WDIR", "WSPD"]
         # Convert P02 IDs to 4-letter codes
         self.sdn_p02_names = [code.split(":")[-1] for code in self.sdn_vocabs_ids["P02"]]
-
-        # Parse Copernicus Params excel file
-        df = pd.read_excel(copernicus_params_file, sheet_name="Parameters", keep_default_na=False, header=1)
-        variables = df["variable name"].dropna().values
-        variables = [v.split(" (")[0] for v in variables]  # remove citations
-        variables = [v for v in variables if len(v) > 1]   # remove empty lines
+        self.sdn_p02_names_set = frozenset(self.sdn_p02_names)
+
+        # Parse Copernicus Params excel file, reading xlsx files is slow so the variables are stored in a CSV file
+        copernicus_csv = os.path.join(emso_dir, "copernicus_variables.csv")
+        if not os.path.exists(copernicus_csv) or copernicus_params_file in updated_files:
+            df = pd.read_excel(copernicus_params_file, sheet_name="Parameters", keep_default_na=False, header=1)
+            variables = df["variable name"].dropna().values
+            variables = [v.split(" (")[0] for v in variables]  # remove citations
+            variables = [v for v in variables if len(v) > 1]   # remove empty lines
+            pd.DataFrame({"variable": variables}).to_csv(copernicus_csv, index=False)
+        else:
+            variables = pd.read_csv(copernicus_csv, dtype=str, keep_default_na=False, engine="c")["variable"].tolist()
         self.copernicus_variables = variables
+        self.copernicus_variables_set = frozenset(variables)
+
+        self.__store_state(state_file, state_key)
 
+    def __load_state(self, state_file, key) -> bool:
+        """
+        Restores the attributes stored by __store_state, only if the stored key matches
+        :param state_file: pickle file with the state
+        :param key: key identifying the input files
+        :returns: True if the state has been restored, False otherwise
+        """
+        if not os.path.isfile(state_file):
+            return False
+        try:
+            with open(state_file, "rb") as f:
+                state = pickle.load(f)
+            if state["key"] != key:
+                return False
+            self.__dict__.update(state["attributes"])
+            self.sdn_relations_by_target = {}
+            return True
+        except Exception as e:  # corrupted or incompatible state, just process the files again
+            rich.print(f"[yellow]Ignoring EMSO metadata cache {state_file}: {e}")
+            return False
+
+    def __store_state(self, state_file, key):
+        """
+        Stores all the attributes into a pickle file, along with the key identifying the input files. The relation maps
+        built lazily by get_relations are not stored, so the stored state does not depend on previous queries
+        :param state_file: pickle file with the state
+        :param key: key identifying the input files
+        """
+        tmp_file = state_file + ".part"
+        with open(tmp_file, "wb") as f:
+            attributes = {k: v for k, v in self.__dict__.items() if k != "sdn_relations_by_target"}
+            pickle.dump({"key": key, "attributes": attributes}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, state_file)
 
     @staticmethod
     def clear_downloads():
@@ -399,6 +523,37 @@ class EmsoMetadata:
             if os.path.isfile(f):
                 os.remove(f)
 
+    @staticmethod
+    def load_cached_sdn_vocab(emso_dir, vocab, jsonld_file, updated):
+        """
+        Loads a SDN vocab from its CSV and relation files in .emso. If they do not exist or the JSON-ld file has been
+        updated, the JSON-ld file is processed and the CSV and relation files are generated.
+        :param emso_dir: path to the .emso conf dir
+        :param vocab: vocab identifier, e.g. P01
+        :param jsonld_file: raw SeaDataNet JSON-ld file
+        :param updated: if True the JSON-ld file has been downloaded again
+        :returns: tuple with (dataframe, narrower, broader, related)
+        """
+        csv_filename = os.path.join(emso_dir, f"{vocab}.csv")
+        frelated = os.path.join(emso_dir, "relations",  f"{vocab}.related")
+        fnarrower = os.path.join(emso_dir, "relations",  f"{vocab}.narrower")
+        fbroader = os.path.join(emso_dir, "relations",  f"{vocab}.broader")
+        if os.path.exists(csv_filename) and not updated:
+            df = pd.read_csv(csv_filename, usecols=_sdn_vocab_columns, dtype=str, engine="c")
+            related = load_json_file(frelated)
+            narrower = load_json_file(fnarrower)
+            broader = load_json_file(fbroader)
+        else:
+            rich.print(f"Loading SDN {vocab}...")
+            df, narrower, broader, related = EmsoMetadata.load_sdn_vocab(jsonld_file)
+            rich.print(f"[green]SDN {vocab} done!")
+            for filename, values in {fnarrower: narrower, fbroader: broader, frelated: related}.items():
+                dump_json_file(values, filename)
+            # Storing to CSV to make it easier to search
+            df = df[_sdn_vocab_columns]
+            df.to_csv(csv_filename, index=False)
+        return df, narrower, broader, related
+
     @staticmethod
     def load_sdn_vocab(filename):
         """
@@ -411,16 +566,13 @@ class EmsoMetadata:
         return df, narrower, broader, related
 
     @staticmethod
+    @functools.lru_cache(maxsize=4096)
     def harmonize_uri(uri):
         """
-        Takes a SDN URI and make sure that uses http instead of https and that it finishes with a /
+        Takes a SDN URI and make sure that uses http instead of https and that it finishes with a /. Cached, as the same
+        URIs are harmonized over and over during lookups
         """
-        if uri.startswith("https"):
-            uri = uri.replace("https", "http")
-
-        if not uri.endswith("/"):
-            uri += "/"
-        return uri
+        return _harmonize_uri(uri)
 
     def vocab_get(self, vocab_id, uri, key):
         """
@@ -431,13 +583,12 @@ class EmsoMetadata:
         if key not in __allowed_keys:
             raise ValueError(f"Key '{key}' not valid, allowed keys: {__allowed_keys}")
 
-        df = self.sdn_vocabs[vocab_id]
-        row = df.loc[df["uri"] == uri]
-        if row.empty:
+        i = self.sdn_vocabs_uri_index[vocab_id].get(uri)
+        if i is None:
             #raise LookupError(f"Could not get {key} for '{uri}' in vocab {vocab_id}")
             rich.print(f"[red]Could not get {key} for '{uri}' in vocab {vocab_id}")
             return ""
-        return row[key].values[0]
+        return self.sdn_vocabs[vocab_id][key].values[i]
 
     def vocab_get_by_urn(self, vocab_id, urn, key):
         """
@@ -447,11 +598,10 @@ class EmsoMetadata:
         if key not in __allowed_keys:
             raise ValueError(f"Key '{key}' not valid, allowed keys: {__allowed_keys}")
 
-        df = self.sdn_vocabs[vocab_id]
-        row = df.loc[df["id"] == urn]
-        if row.empty:
+        i = self.sdn_vocabs_id_index[vocab_id].get(urn)
+        if i is None:
             raise LookupError(f"Could not get {key} for '{urn}' in vocab {vocab_id}")
-        return row[key].values[0]
+        return self.sdn_vocabs[vocab_id][key].values[i]
 
     def get_relations(self, vocab_id, uri, relation, target_vocab):
         """
@@ -483,20 +633,18 @@ class EmsoMetadata:
         else:  # related
             relations = self.sdn_vocabs_related[vocab_id]
 
-        try:
-            uri_relations = relations[uri]
-        except KeyError:
+        if uri not in relations:
             rich.print(f"[red]relation {relation} for {uri} not found!")
             return ""
 
-        if type(uri_relations) is str:  # make sure it's a list
-            uri_relations = [uri_relations]
-
-        results = []
-        for term in uri_relations:
-            if target_vocab in term:
-                results.append(term)
-        return results
+        # The terms of every URI are filtered by target vocab only once, later calls are a dict lookup
+        key = (vocab_id, relation, target_vocab)
+        if key not in self.sdn_relations_by_target:
+            self.sdn_relations_by_target[key] = {
+                term_uri: [term for term in ([terms] if type(terms) is str else terms) if target_vocab in term]
+                for term_uri, terms in relations.items()
+            }
+        return list(self.sdn_relations_by_target[key][uri])
 
     def get_relation(self, vocab_id, uri, relation, target_vocab):
         """
@@ -510,3 +658,22 @@ class EmsoMetadata:
             raise LookupError(f"Expected 1 value, got {len(results)}")
 
         return results[0]
+
+
+# Shared EmsoMetadata instance, building it downloads and parses all vocabularies, so it is only done once
+__emso_metadata = None
+__emso_metadata_lock = threading.Lock()
+
+
+def get_emso_metadata(force_update=False) -> EmsoMetadata:
+    """
+    Returns a shared EmsoMetadata instance, creating it on the first call. Thread-safe, concurrent callers wait for the
+    instance being built instead of creating their own
+    :param force_update: if True the instance is built again, checking the remote resources for updates
+    :returns: EmsoMetadata object
+    """
+    global __emso_metadata
+    with __emso_metadata_lock:
+        if __emso_metadata is None or force_update:
+            __emso_metadata = EmsoMetadata(force_update)
+        return __emso_metadata
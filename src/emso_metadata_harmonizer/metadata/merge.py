@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import rich
 
@@ -14,16 +15,12 @@ def merge_waterframes(waterframes):
     structure
     """
     dataframes = []  # list of dataframes
+    sensor_ids = []  # sensor id for every dataframe
     global_attr = []  # list of dict containing global attributes
     variables_attr = {}  # dict all the variables metadata
     for wf in waterframes:
-        df = wf.data
-        # setting time as the index
-        df = df.set_index("TIME")
-        df = df.sort_index(ascending=True)
-        df["SENSOR_ID"] = wf.metadata["$sensor_id"]
-
-        dataframes.append(df)
+        dataframes.append(wf.data)
+        sensor_ids.append(np.full(len(wf.data), wf.metadata["$sensor_id"], dtype=object))
         global_attr.append(wf.metadata)
         for varname, varmeta in wf.vocabulary.items():
             if varname not in variables_attr.keys():
@@ -31,9 +28,11 @@ def merge_waterframes(waterframes):
             else:
                 variables_attr[varname].append(varmeta)
 
-    df = pd.concat(dataframes)  # Consolidate data in a single dataframe
-    df = df.sort_index(ascending=True)  # sort by date
-    df = df.reset_index()  # get back to numerical index
+    # Consolidate data in a single dataframe and sort it by date. Sorting only once after concatenating avoids
+    # creating intermediate copies of every dataframe
+    df = pd.concat(dataframes, ignore_index=True)
+    df["SENSOR_ID"] = np.concatenate(sensor_ids)
+    df = df.sort_values("TIME", kind="stable", ignore_index=True)
 
     # Consolidating Global metadata, the position in the array is the priority
     global_meta = {}
@@ -43,6 +43,12 @@ def sensor_metadata():
     }
 
 
+# OceanSITES QC flags, copied into a new list by quality_control_metadata
+_qc_flag_values = (0, 1, 2, 3, 4, 7, 8, 9)
+_qc_flag_meanings = ("unknown", "good_data", "probably_good_data", "potentially_correctable_bad_data", "bad_data",
+                     "nominal_value", "interpolated_value", "missing_value")
+
+
 def quality_control_metadata(long_name):
     """
     Returns the minimal attributes for a quality control variable
@@ -50,52 +56,57 @@ def quality_control_metadata(long_name):
     return {
         "long_name": long_name + " quality control flags",
         "conventions": "OceanSITES QC Flags",
-        "flag_values": [0, 1, 2, 3, 4, 7, 8, 9],
-        "flag_meanings": ["unknown", "good_data", "probably_good_data", "potentially_correctable_bad_data",
-                          "bad_data", "nominal_value", "interpolated_value", "missing_value"]
+        "flag_values": list(_qc_flag_values),
+        "flag_meanings": list(_qc_flag_meanings)
     }
 
-def dimension_metadata(dim):
 
-    __dimension_metadata = {
-        "TIME": {
-            "long_name": "time of measurements",
-            # UNIX time: seconds since 1970
-            "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ELTMEP01/",
-            "standard_name": "time",
-            # Days since 1950
-            # "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ELTJLD01/"
-            "axis": "T",
-            "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/UTBB/"
-        },
-        "DEPTH": {
-            "long_name": "depth of measurements",
-            "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ADEPZZ01",
-            "standard_name": "depth",
-            "axis": "Z",
-            "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/ULAA/"
-        },
-        "LATITUDE": {
-            "long_name": "latitude of measurements",
-            "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ALATZZ01",
-            "standard_name": "latitude",
-            "axis": "Y",
-            "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/UAAA/"
-        },
-        "LONGITUDE": {
-            "long_name": "longitude of measurements",
-            "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ALONZZ01",
-            "standard_name": "longitude",
-            "axis": "X",
-            "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/UAAA/"
-        },
-        "SENSOR_ID": {
-            "long_name": "Identifier of the sensor that took the measurement"
-        }
+# Default metadata for every dimension, copied by dimension_metadata
+_dimension_metadata = {
+    "TIME": {
+        "long_name": "time of measurements",
+        # UNIX time: seconds since 1970
+        "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ELTMEP01/",
+        "standard_name": "time",
+        # Days since 1950
+        # "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ELTJLD01/"
+        "axis": "T",
+        "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/UTBB/"
+    },
+    "DEPTH": {
+        "long_name": "depth of measurements",
+        "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ADEPZZ01",
+        "standard_name": "depth",
+        "axis": "Z",
+        "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/ULAA/"
+    },
+    "LATITUDE": {
+        "long_name": "latitude of measurements",
+        "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ALATZZ01",
+        "standard_name": "latitude",
+        "axis": "Y",
+        "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/UAAA/"
+    },
+    "LONGITUDE": {
+        "long_name": "longitude of measurements",
+        "sdn_parameter_uri": "https://vocab.nerc.ac.uk/collection/P01/current/ALONZZ01",
+        "standard_name": "longitude",
+        "axis": "X",
+        "sdn_uom_uri": "http://vocab.nerc.ac.uk/collection/P06/current/UAAA/"
+    },
+    "SENSOR_ID": {
+        "long_name": "Identifier of the sensor that took the measurement"
     }
-    if dim not in __dimension_metadata.keys():
-        raise LookupError(f"Not a valid dimension '{dim}'. Expected one of the following {list(__dimension_metadata.keys())}")
-    return __dimension_metadata[dim].copy()
+}
+
+
+def dimension_metadata(dim):
+    """
+    Returns a copy of the default metadata of a dimension
+    """
+    if dim not in _dimension_metadata:
+        raise LookupError(f"Not a valid dimension '{dim}'. Expected one of the following {list(_dimension_metadata)}")
+    return _dimension_metadata[dim].copy()
 
 
 def global_metadata():
@@ -197,10 +208,8 @@ def choose_interactively(attr_name: str, hint: str, options: list) -> str:
     n = len(options)
     while not valid_option:
         rich.print(f"[cyan]Select one of the following values for the '{attr_name}' attribute ('{hint}')")
-        for i in range(n):
-            if i < 9:
-                rich.print(" ", end="")
-            rich.print(f"{i + 1} - {options[i]}")
+        # print all options at once, one rich.print per option is slow for long lists
+        rich.print("\n".join(f"{i + 1:>2} - {options[i]}" for i in range(n)))
         inp = input("Selection: ")
         try:
             selection = int(inp.strip())
@@ -22,6 +22,10 @@ import numpy as np
 from .utils import avoid_filename_collision
 from .waterframe import WaterFrame
 
+# json.dump writes many small chunks, a large buffer reduces the number of writes to disk
+_json_buffer_size = 1 << 20
+
+
 def generate_min_meta_template(wf: WaterFrame, folder: str):
     """
     Takes a data frame and generates the a minimal metadata file from which the rest of the metadata can be derived
@@ -52,28 +56,27 @@ def generate_min_meta_template(wf: WaterFrame, folder: str):
 
     datafile = wf.metadata["$datafile"]
     # create a filename
-    a = os.path.basename(datafile).split(".")
-    filename = ".".join(a[:-1]) + ".min.json"
-    filename = os.path.join(folder, filename)
+    stem = os.path.splitext(os.path.basename(datafile))[0]
+    filename = os.path.join(folder, stem + ".min.json")
 
     # Do not overwrite file.txt, but create file(1).txt
 
     if os.path.exists(filename):
         filename = avoid_filename_collision(filename)
 
-    with open(filename, "w") as f:
-        f.write(json.dumps(m, indent=2))
+    with open(filename, "w", buffering=_json_buffer_size) as f:
+        json.dump(m, f, indent=2)
 
     mfiles.append(filename)
-    [rich.print(f"    {f}") for f in mfiles]
+    rich.print("\n".join(f"    {f}" for f in mfiles))
 
 
 def process_selectable_metadata(m, filename=""):
     """
     Asks the user to interactively choose missing parameters
     """
-    # Processing interactive values
-    for key, value in m.copy().items():
+    # Processing interactive values. Only the values of existing keys are modified, so no need to copy the dict
+    for key, value in m.items():
         if key.startswith("$"):
             k = key[1:]
             if not value:
@@ -89,11 +92,10 @@ def remove_minmeta_keys(m):
     """
     Removes the minmeta leading keys (* ~ $)
     """
-    # Process the rest of the params...
-    for key, value in m.copy().items():
-        if key.startswith("~") or key.startswith("*") or key.startswith("$"):
-            del m[key]
-            m[key[1:]] = value  # remove leading *
+    # Process the rest of the params, iterate over a snapshot of the keys as they are renamed in place
+    for key in list(m):
+        if key[:1] in ("~", "*", "$"):
+            m[key[1:]] = m.pop(key)  # remove leading *
 
     if "README" in m.keys():
         del m["README"]
@@ -135,21 +137,21 @@ def load_min_meta(wf: WaterFrame, metadata: dict, emso: EmsoMetadata) -> dict:
     metadata["global"] = process_selectable_metadata(metadata["global"], filename=minimal_metadata_file)
     metadata["sensor"] = process_selectable_metadata(metadata["sensor"], filename=minimal_metadata_file)
     metadata["coordinates"] = process_selectable_metadata(metadata["coordinates"], filename=minimal_metadata_file)
-    for var, m in metadata["variables"].items():
-        metadata["variables"][var] = process_selectable_metadata(m, filename=minimal_metadata_file)
 
     # Make sure that we have all the necessary info
     check_mandatory_fields(metadata["global"])
     check_mandatory_fields(metadata["sensor"])
+
+    # Variables are processed and checked in a single pass
     for var, m in metadata["variables"].items():
-        check_mandatory_fields(m)
+        metadata["variables"][var] = process_selectable_metadata(m, filename=minimal_metadata_file)
+        check_mandatory_fields(metadata["variables"][var])
 
-    metadata = metadata.copy()
     metadata = autofill_minmeta(metadata, emso)
 
     if minimal_metadata_file:
         rich.print(f"Updating file {minimal_metadata_file} with selected user choices...", end="")
-        with open(minimal_metadata_file, "w") as f:
+        with open(minimal_metadata_file, "w", buffering=_json_buffer_size) as f:
             json.dump(metadata, f, indent=2)  # update the file, so
         rich.print("[green]done!")
 
@@ -170,23 +172,19 @@ def check_mandatory_fields(m):
     """
     Checks that all fields starting with * are filled
     """
-    m = m.copy()
-    error = False
-
-    # First check all mandatory fields
-    for key, value in m.copy().items():
-        if key.startswith("*") and not value:
-            error = True
-            rich.print(f"[red]Mandatory field missing: \"{key}\"")
-        if error:
-            raise SyntaxError("Missing fields detected! Please fill all fields starting with '*'")
+    missing = [key for key, value in m.items() if key.startswith("*") and not value]
+    if missing:
+        rich.print("\n".join(f"[red]Mandatory field missing: \"{key}\"" for key in missing))
+        raise SyntaxError("Missing fields detected! Please fill all fields starting with '*'")
 
 def np_encoder(object):
     """
-    Encodes Numpy data for JSON lib
+    Encodes Numpy data for JSON lib, scalars are converted to Python numbers and arrays to lists
     """
     if isinstance(object, np.generic):
         return object.item()
+    elif isinstance(object, np.ndarray):
+        return object.tolist()
 
 def generate_full_metadata(wf: WaterFrame, folder):
     """
@@ -195,12 +193,12 @@ def generate_full_metadata(wf: WaterFrame, folder):
 
     os.makedirs(folder, exist_ok=True)
     # metadata file will be the datafile with full.json extension
-    metafile = ".".join(wf.metadata["$datafile"].split(".")[:-1]) + ".full.json"
-    metafile = os.path.join(folder, metafile)
+    stem = os.path.splitext(os.path.basename(wf.metadata["$datafile"]))[0]
+    metafile = os.path.join(folder, stem + ".full.json")
     wf.metadata["$fullmeta"] = metafile
     rich.print(f"Storing full metadata into {metafile}...", end="")
     metadata = extract_netcdf_metadata(wf)
-    with open(metafile, "w") as f:
-        f.write(json.dumps(metadata, indent=2, default=np_encoder))
+    with open(metafile, "w", buffering=_json_buffer_size) as f:
+        json.dump(metadata, f, indent=2, default=np_encoder)
     rich.print("[green]done!")
 
@@ -34,24 +34,23 @@ def wf_to_multidim_nc(wf: WaterFrame, filename: str, dimensions: list, fill_valu
 
     df = wf.data  # Access the DataFrame within the waterframe
     index_df = df[dimensions].copy()  # create a dataframe with only the variables that will be used as indexes
-    multiindex = pd.MultiIndex.from_frame(index_df)  # create a multiindex from the dataframe
 
-    # Arrange other variables into a dict
-    data = {col: df[col].values for col in df.columns if col not in dimensions}
-
-    # Create a dataframe with multiindex
-    data_df = pd.DataFrame(data, index=multiindex)
+    # All other columns are data variables, values are taken directly from the dataframe to avoid copying it
+    data_variables = [col for col in df.columns if col not in dimensions]
     dimensions = tuple(dimensions)
 
     with nc.Dataset(filename, "w", format="NETCDF4") as ncfile:
         for dimension in dimensions:
             data = index_df[dimension].values
-            values = np.unique(data)  # fixed-length dimension
             if dimension == time_key:
-                # convert timestamp to float
-                index_df[time_key] = pd.to_datetime(index_df[time_key])
-                times = index_df[time_key].dt.to_pydatetime()
-                values = nc.date2num(times, "seconds since 1970-01-01", calendar="standard")
+                # convert timestamp to seconds since 1970 as float, operating on the datetime64 values directly
+                # instead of creating a datetime object for every row. Microsecond resolution, as date2num
+                times = pd.to_datetime(data).values
+                values = times.astype("datetime64[us]").astype(np.int64) / 1e6
+            else:
+                # fixed-length dimension. Hash-based deduplication and then sorting only the unique values is cheaper
+                # than np.unique, which sorts the whole column
+                values = np.sort(pd.unique(data))
 
             ncfile.createDimension(dimension, len(values))  # create dimension
             if type(values[0]) == str:  # Some dimension may be a string (e.g. sensor_id)
@@ -63,15 +62,10 @@ def wf_to_multidim_nc(wf: WaterFrame, filename: str, dimensions: list, fill_valu
             var[:] = values  # assign dimension values
 
             # add all dimension metadata
+            var.setncatts(join_list_attributes(wf.vocabulary[dimension], join_attr))
 
-            for key, value in wf.vocabulary[dimension].items():
-                if type(value) == list:
-                    values = [str(v) for v in value]
-                    value = join_attr.join(values)
-                var.setncattr(key, value)
-
-        for varname in data_df.columns:
-            values = data_df[varname].to_numpy()  # assign values to the variable
+        for varname in data_variables:
+            values = df[varname].to_numpy()  # assign values to the variable
             if varname.endswith("_QC"):
                 # Store Quality Control as unsigned bytes
                 var = ncfile.createVariable(varname, "u1", dimensions, fill_value=fill_value_uint8, zlib=True)
@@ -81,18 +75,25 @@ def wf_to_multidim_nc(wf: WaterFrame, filename: str, dimensions: list, fill_valu
                 var[:] = values
 
             # Adding metadata
-            for key, value in wf.vocabulary[varname].items():
-                if type(value) == list:
-                    values = [str(v) for v in value]
-                    value = join_attr.join(values)
-                var.setncattr(key, value)
+            var.setncatts(join_list_attributes(wf.vocabulary[varname], join_attr))
 
         # Set global attibutes
-        for key, value in wf.metadata.items():
-            if type(value) == list:
-                values = [str(v) for v in value]
-                value = join_attr.join(values)
-            ncfile.setncattr(key, value)
+        ncfile.setncatts(join_list_attributes(wf.metadata, join_attr))
+
+
+def join_list_attributes(attributes: dict, join_attr: str) -> dict:
+    """
+    Converts list attributes into strings, so all the attributes can be set at once with setncatts
+    :param attributes: dict with the attributes
+    :param join_attr: separator used to join list values
+    :returns: new dict with the list values joined
+    """
+    joined = {}
+    for key, value in attributes.items():
+        if type(value) == list:
+            value = join_attr.join(map(str, value))
+        joined[key] = value
+    return joined
 
 
 def read_nc(path, decode_times=True, time_key="TIME"):
@@ -219,47 +219,44 @@ class EmsoMetadataTester:
         results["value"].append(value)
         return passed, message, value
 
-    def __test_group_handler(self, test_group: pd.DataFrame, metadata: dict, variable: str, verbose: bool, results={}
+    @staticmethod
+    def __parse_test_group(test_group: pd.DataFrame) -> (list, set):
+        """
+        Converts a table of tests from the metadata specification into a list of tuples, so it can be applied to many
+        variables without iterating the DataFrame every time
+        :param test_group: DataFrame of the group of tests required
+        :returns: list of (attribute, test_name, args, required, multiple) tuples and a set with all the attributes
+        """
+        attribute_col = test_group.columns[0]
+        tests = []
+        for attribute, test_name, required, multiple in zip(test_group[attribute_col], test_group["Compliance test"],
+                                                           test_group["Required"], test_group["Multiple"]):
+            args = []
+            if test_name and "#" in test_name:
+                test_name, args = test_name.split("#")
+                args = args.split(",")  # comma-separated fields are args
+            tests.append((attribute, test_name, args, required, multiple))
+        return tests, set(test_group[attribute_col].values)
+
+    def __test_group_handler(self, tests: list, checks: set, metadata: dict, variable: str, verbose: bool, results: dict
                              ) -> dict:
         """
         Takes a list of tests from the metadata specification and applies it to the metadata json structure
-        :param test_group: DataFrame of the group of tests required
+        :param tests: list of tests, as returned by __parse_test_group
+        :param checks: set of attributes covered by the tests
         :param metadata: JSON structure (dict) under test
         :param variable: Variable being tested, 'global' for global dataset attributes
         :param verbose: if True, will add attributes present in the dataset but not required by the standard.
-        :param results: a dict to store the results. If empty a new one will be created
+        :param results: a dict to store the results
         :returns: result structure
         """
-        if not results:
-            results = {
-                "attribute": [],
-                "variable": [],
-                "required": [],
-                "passed": [],
-                "message": [],
-                "value": []
-            }
-        attribute_col = test_group.columns[0]
-
-        # Run Global Attributes test
-        for _, row in test_group.iterrows():
-            attribute = row[attribute_col]
-            test_name = row["Compliance test"]
-            required = row["Required"]
-            multiple = row["Multiple"]
+        for attribute, test_name, args, required, multiple in tests:
             if not test_name:
                 rich.print(f"[yellow]WARNING: test for {attribute} not implemented!")
                 continue
-
-            args = []
-            if "#" in test_name:
-                test_name, args = test_name.split("#")
-                args = args.split(",")  # comma-separated fields are args
-
             self.__run_test(test_name, args, attribute, metadata, required, multiple, variable, results)
 
         if verbose:  # add all parameters not listed in the standard
-            checks = list(test_group[attribute_col].values)
             for key, value in metadata.items():
                 if key not in checks:
                     results["attribute"].append(key)
@@ -292,31 +289,36 @@ class EmsoMetadataTester:
 
         rich.print(f"#### Validating dataset [cyan]{metadata['global']['title']}[/cyan] ####")
 
-        # Test global attributes
-        results = self.__test_group_handler(self.metadata.global_attr, metadata["global"], "global", verbose)
-
-        # Test every dimension
-        for varname, var_metadata in metadata["dimensions"].items():
-            if varname.lower() == "sensor_id":
-                # Deliberately skip sensor_id
-                continue
-            # First check variable name manually
+        results = {
+            "attribute": [],
+            "variable": [],
+            "required": [],
+            "passed": [],
+            "message": [],
+            "value": []
+        }
 
-            results = self.__test_group_handler(self.metadata.dimension_attr, metadata["dimensions"][varname], varname,
-                                                verbose, results)
+        # Tests to be applied to every section. Global attributes are a single element named 'global'
+        section_tests = {
+            "global": self.metadata.global_attr,
+            "dimensions": self.metadata.dimension_attr,
+            "variables": self.metadata.variable_attr,
+            "qc": self.metadata.qc_attr,
+            "technical": self.metadata.technical_attr
+        }
 
-        # Test every variable
-        for varname, var_metadata in metadata["variables"].items():
-            results = self.__test_group_handler(self.metadata.variable_attr, metadata["variables"][varname], varname,
-                                                verbose, results)
-        # Test every QC column
-        for varname, var_metadata in metadata["qc"].items():
-            results = self.__test_group_handler(self.metadata.qc_attr, metadata["qc"][varname], varname,
-                                                verbose, results)
+        # Run all the tests in a single traversal, parsing each test table only once
+        for section, test_group in section_tests.items():
+            tests, checks = self.__parse_test_group(test_group)
+            if section == "global":
+                elements = {"global": metadata["global"]}
+            else:
+                elements = metadata[section]
 
-        for varname, var_metadata in metadata["technical"].items():
-            results = self.__test_group_handler(self.metadata.technical_attr, metadata["technical"][varname], varname,
-                                                verbose, results)
+            for varname, var_metadata in elements.items():
+                if section == "dimensions" and varname.lower() == "sensor_id":
+                    continue  # Deliberately skip sensor_id
+                self.__test_group_handler(tests, checks, var_metadata, varname, verbose, results)
 
         df = pd.DataFrame(results)
         total, required, optional = self.__process_results(df, verbose=verbose)
@@ -361,7 +363,7 @@ class EmsoMetadataTester:
                 value = int(value)
             except ValueError:
                 return False, f"'{value}' is not a valid EDMO code"
-        if value in self.metadata.edmo_codes["code"].values:
+        if value in self.metadata.edmo_codes_set:
             return True, ""
         return False, f"'{value}' is not a valid EDMO code"
 
@@ -374,7 +376,7 @@ class EmsoMetadataTester:
             uri = uri[:-1]  # remove ending /
 
 
-        if value in self.metadata.edmo_codes["uri"].values:
+        if value in self.metadata.edmo_uris_set:
             return True, ""
 
         return False, f"'{value}' is not a valid EDMO code"
@@ -392,7 +394,7 @@ class EmsoMetadataTester:
             raise ValueError(
                 f"Vocabulary '{vocab}' not loaded! Loaded vocabs are {self.metadata.sdn_vocabs_ids.keys()}")
 
-        if value in self.metadata.sdn_vocabs_ids[vocab]:
+        if value in self.metadata.sdn_vocabs_id_index[vocab]:
             return True, ""
 
         return False, f"Not a valid '{vocab}' URN"
@@ -409,7 +411,7 @@ class EmsoMetadataTester:
             raise ValueError(
                 f"Vocabulary '{vocab}' not loaded! Loaded vocabs are {self.metadata.sdn_vocabs_pref_label.keys()}")
 
-        if value in self.metadata.sdn_vocabs_pref_label[vocab]:
+        if value in self.metadata.sdn_vocabs_pref_label_set[vocab]:
             return True, ""
 
         return False, f"Not a valid '{vocab}' prefered label"
@@ -424,7 +426,7 @@ class EmsoMetadataTester:
             raise ValueError(
                 f"Vocabulary '{vocab}' not loaded! Loaded vocabs are {self.metadata.sdn_vocabs_pref_label.keys()}")
 
-        if value in self.metadata.sdn_vocabs_pref_label[vocab]:
+        if value in self.metadata.sdn_vocabs_pref_label_set[vocab]:
             return True, ""
         return False, f"Not a valid '{vocab}' prefered label"
 
@@ -446,7 +448,7 @@ class EmsoMetadataTester:
             raise ValueError(
                 f"Vocabulary '{vocab}' not loaded! Loaded vocabs are {self.metadata.sdn_vocabs_uris.keys()}")
 
-        if uri in self.metadata.sdn_vocabs_uris[vocab]:
+        if uri in self.metadata.sdn_vocabs_uri_set[vocab]:
             return True, ""
 
         return False, f"Not a valid '{vocab}' URI"
@@ -485,14 +487,14 @@ class EmsoMetadataTester:
 
     # -------- SPDX Licenses -------- #
     def spdx_license_name(self, value, args):
-        if value in self.metadata.spdx_license_names:
+        if value in self.metadata.spdx_license_names_set:
             return True, ""
         return False, "Not a valid SPDX license code"
 
     def spdx_license_uri(self, value, args):
         value = value.replace("http://", "https://")  # ensure https
         value = value.replace(".jsonld", "").replace(".json", "").replace(".html", "")  # delete format
-        if value in self.metadata.spdx_license_uris.values():
+        if value in self.metadata.spdx_license_uris_set:
             return True, ""
         return False, f"Not a valid SDPX license uri '{value}'"
 
@@ -591,9 +593,9 @@ class EmsoMetadataTester:
         """
         if value in self.metadata.oceansites_param_codes:
             return True, "Variable name found in OceanSITES"
-        elif value in self.metadata.sdn_p02_names:
+        elif value in self.metadata.sdn_p02_names_set:
             return True, "Variable name found in P02"
-        elif value in self.metadata.copernicus_variables:
+        elif value in self.metadata.copernicus_variables_set:
             return True, "Variable name found in Copernicus INSTAC codes"
         else:
             return False, "Parameter name not found in OceanSITES, P02 and Copernicus!"
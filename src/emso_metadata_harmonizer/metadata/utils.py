@@ -10,12 +10,20 @@ created: 26/4/23
 """
 import rich
 from rich.progress import Progress
-import urllib
+import shutil
+import threading
 import concurrent.futures as futures
 import os
+import json
+import re
 from .constants import dimensions
 import numpy as np
 
+try:  # orjson is optional, if installed it is used to speed up (de)serialization of large JSON files
+    import orjson
+except ImportError:
+    orjson = None
+
 
 def group_metadata_variables(metadata):
     """
@@ -95,21 +103,78 @@ def threadify(arg_list, handler, max_threads=10):
         return final_results
 
 
+# Shared HTTP session, keeps connections alive so files from the same host reuse them. Created on first use, so that
+# requests (which is quite slow to import) is only loaded when something has to be downloaded
+__session = None
+__session_lock = threading.Lock()
+__download_chunk_size = 1 << 16  # bytes written to disk at once while streaming a download
+# seconds to wait for the connection and for new data before giving up. The read timeout is long, as some endpoints
+# (e.g. EDMO SPARQL) take a while to start sending their response
+__download_timeout = (10, 300)
+
+
+def __get_session():
+    """
+    Returns the shared HTTP session, creating it if needed
+    """
+    global __session
+    with __session_lock:
+        if __session is None:
+            import requests
+            import urllib3
+            __session = requests.Session()
+            # Certificates are not verified, as the previous urllib downloads did with an unverified SSL context, so
+            # hosts serving an incomplete certificate chain do not break the EMSO resources download
+            __session.verify = False
+            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        return __session
+
+
 def download_file(url, file):
     """
-    wrapper for urllib.error.HTTPError
+    Downloads a file from url. The contents are streamed into a temporary file which is renamed once the download is
+    complete, so an interrupted download never leaves a partial file behind. The ETag and Last-Modified headers are
+    stored in a <file>.etag sidecar, so if the file already exists it is only downloaded again if it has been modified
+    :returns: file if it has been downloaded, None if it was not modified
     """
+    import requests
+    tmp_file = file + ".part"
+    etag_file = file + ".etag"
+    headers = {}
+    if os.path.isfile(file) and os.path.isfile(etag_file):
+        validators = load_json_file(etag_file)
+        if validators.get("etag"):
+            headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            headers["If-Modified-Since"] = validators["last_modified"]
     try:
-        return urllib.request.urlretrieve(url, file)
-    except urllib.error.HTTPError as e:
+        with __get_session().get(url, stream=True, headers=headers, timeout=__download_timeout) as r:
+            r.raise_for_status()
+            if r.status_code == 304:  # Not Modified, keep the current file
+                return None
+            r.raw.decode_content = True  # decompress gzip/deflate encoded responses
+            with open(tmp_file, "wb") as f:
+                shutil.copyfileobj(r.raw, f, __download_chunk_size)  # memory use bounded to one chunk
+        os.replace(tmp_file, file)
+        dump_json_file({"etag": r.headers.get("ETag"), "last_modified": r.headers.get("Last-Modified")}, etag_file)
+    except requests.HTTPError as e:
         rich.print(f"[red]{str(e)}")
         rich.print(f"[red]Could not download from {url} to file {file}")
         raise e
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    return file
 
 
 def download_files(tasks, force_download=False):
-    if len(tasks) == 1:
-        return None
+    """
+    Downloads all files in tasks concurrently. Files already present are skipped, unless force_download is set. Then
+    they are requested again, but only downloaded if modified in the server.
+    :param tasks: list of [url, file, name]
+    :param force_download: check files that already exist
+    :returns: list of downloaded files
+    """
     args = []
     for url, file, name in tasks:
         if os.path.isfile(file) and not force_download:
@@ -117,7 +182,24 @@ def download_files(tasks, force_download=False):
         else:
             args.append((url, file))
 
-    threadify(args, download_file)
+    if not args:
+        return []
+    results = threadify(args, __download_task, max_threads=len(args))  # downloads are I/O bound, one thread per file
+    errors = [error for file, error in results if error]
+    if errors:  # raised once all the downloads have finished, so a failing host does not interrupt the others
+        raise errors[0]
+    return [file for file, error in results if file]
+
+
+def __download_task(url, file):
+    """
+    Calls download_file, but returns the exception instead of raising it
+    :returns: tuple with (downloaded file or None, exception or None)
+    """
+    try:
+        return download_file(url, file), None
+    except Exception as e:
+        return None, e
 
 
 def drop_duplicates(df, timestamp="time"):
@@ -218,3 +300,80 @@ def get_file_list(dir_name):
         else:
             all_files.append(full_path)
     return all_files
+
+
+def load_json_file(filename):
+    """
+    Loads a JSON file. If available orjson is used, otherwise fall back to the standard json library. Unlike json,
+    orjson rejects NaN and Infinity literals, so this is only meant for files generated by this package (downloaded
+    vocabularies, ETags), never for user-edited metadata files
+    :param filename: path to the JSON file
+    :returns: decoded JSON object
+    """
+    if orjson:
+        with open(filename, "rb") as f:
+            return orjson.loads(f.read())
+    with open(filename, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def dump_json_file(obj, filename):
+    """
+    Stores an object into a JSON file. If available orjson is used, otherwise fall back to the standard json library.
+    The output depends on the library: orjson writes NaN and Infinity as null and only accepts str keys and integers
+    up to 64 bits, so use it only for files read back by load_json_file, never for user metadata files
+    :param obj: object to be stored
+    :param filename: path to the JSON file
+    """
+    if orjson:
+        with open(filename, "wb") as f:
+            f.write(orjson.dumps(obj))
+    else:
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump(obj, f)
+
+
+# Used by iter_json_items to decode a JSON document piece by piece
+__json_decoder = json.JSONDecoder()
+__whitespace = re.compile(r"\s*")
+
+
+def iter_json_items(filename, key):
+    """
+    Iterates over the elements of the array stored under 'key' in a JSON object, decoding them one by one. The file
+    text is read at once, but unlike json.load the whole document is never decoded into Python objects at the same
+    time, so peak memory stays close to the size of the file instead of the (much larger) decoded document
+    :param filename: path to the JSON file, its root must be an object
+    :param key: top-level key of the array
+    :returns: generator with the decoded elements
+    """
+    with open(filename, encoding="utf-8") as f:
+        doc = f.read()
+
+    def skip(pos, expected=""):
+        pos = __whitespace.match(doc, pos).end()
+        if expected:
+            if doc[pos:pos + 1] != expected:
+                raise ValueError(f"Expected '{expected}' at position {pos} of {filename}")
+            pos = __whitespace.match(doc, pos + 1).end()
+        return pos
+
+    pos = skip(0, "{")
+    while doc[pos:pos + 1] != "}":
+        name, pos = __json_decoder.raw_decode(doc, pos)
+        pos = skip(pos, ":")
+        if name != key:
+            _, pos = __json_decoder.raw_decode(doc, pos)  # decode and discard other values
+        else:
+            pos = skip(pos, "[")
+            while doc[pos:pos + 1] != "]":
+                element, pos = __json_decoder.raw_decode(doc, pos)
+                yield element
+                pos = skip(pos)
+                if doc[pos:pos + 1] != "]":
+                    pos = skip(pos, ",")
+            return
+        pos = skip(pos)
+        if doc[pos:pos + 1] != "}":
+            pos = skip(pos, ",")
+    raise LookupError(f"Key '{key}' not found in {filename}")
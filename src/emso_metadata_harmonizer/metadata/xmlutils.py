@@ -31,10 +31,13 @@ ns = {'swe':'http://www.opengis.net/swe/2.0',
 __enable_debug__ = False
 
 
-def dbg(*arguments):
+def dbg(message, *args):
+    """
+    Prints a debug message. Like logging, the message is only formatted with args when debug is enabled
+    """
     state = False
     if __enable_debug__:
-        s = str(*arguments)
+        s = message % args if args else str(message)
         for char in s:
             if state == False and char == '\"':
                 state = True
@@ -201,7 +204,7 @@ def get_elements(root, tag, attr=None, attr_value=None):
     :param attr_value: attribute value
     :returns: list of matching elements
     """
-    dbg('looking for tag \"%s\" attr \"%s\" attr_value \"%s\"' % (tag, attr, attr_value))
+    dbg('looking for tag \"%s\" attr \"%s\" attr_value \"%s\"', tag, attr, attr_value)
     # If no attributes only one candidates should be found by tag, otherwise error
     if tag != None and attr == None:
         xpath = './/' + tag
@@ -210,14 +213,14 @@ def get_elements(root, tag, attr=None, attr_value=None):
     # Element with attribute, get all subelements that match the tag with the attribute
     xpath = './/' + tag + '[@%s]' % attr
     candidates = root.findall(xpath, namespaces=ns)
-    dbg('got %d elements  with tag \"%s\"' % (len(candidates), tag))
+    dbg('got %d elements  with tag \"%s\"', len(candidates), tag)
 
     selected = []
     for candidate in candidates:
         if attr in candidate.attrib.keys():
             selected.append(candidate)
 
-    dbg('got %d elements  with attr \"%s\"' % (len(selected), attr))
+    dbg('got %d elements  with attr \"%s\"', len(selected), attr)
 
     # If attribute without value
     if attr_value == None:
@@ -233,7 +236,7 @@ def get_elements(root, tag, attr=None, attr_value=None):
             selected.append(element)
 
     if len(selected) > 0:
-        dbg('got %d elements  with value \"%s\"' % (len(selected), attr_value))
+        dbg('got %d elements  with value \"%s\"', len(selected), attr_value)
         return selected
 
     raise LookupError("Element not found %s %s=%s" % (tag, attr, attr_value))
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Shared pytest configuration for the unit tests that do not require ERDDAP
+
+license: MIT
+created: 16/10/26
+"""
+import os
+import sys
+
+import pytest
+
+# Add the project root to the sys.path, so the tests can import the sources as src.emso_metadata_harmonizer
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)))
+
+
+@pytest.fixture
+def tmpdir_path(request, tmp_path):
+    """
+    Sets the tmpdir attribute of unittest.TestCase tests to a temporary folder, removed by pytest afterwards
+    """
+    request.instance.tmpdir = str(tmp_path)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the dataset loading functions, they do not require ERDDAP
+
+license: MIT
+created: 16/10/26
+"""
+import os
+import unittest
+
+import netCDF4 as nc
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.emso_metadata_harmonizer.metadata.constants import dimensions
+from src.emso_metadata_harmonizer.metadata.dataset import nc_times_to_datetime, csv_detect_header, get_variables, \
+    get_dimensions
+from src.emso_metadata_harmonizer.metadata.waterframe import WaterFrame
+
+
+def num2date(values, units):
+    """
+    Reference conversion with netCDF4
+    """
+    times = nc.num2date(values, units, only_use_python_datetimes=True, only_use_cftime_datetimes=False)
+    return pd.to_datetime(times, utc=True)
+
+
+class NcTimesTester(unittest.TestCase):
+    def test_same_as_num2date(self):
+        """Random float and integer times must be converted exactly as num2date does"""
+        rng = np.random.default_rng(1234)
+        cases = [
+            ("days since 1950-01-01", -3000, 30000),
+            ("days since 1950-01-01T00:00:00Z", 0, 30000),
+            ("seconds since 1970-01-01", -2e9, 2e9),
+            ("hours since 2000-01-01 00:00:00", -1e5, 3e5),
+            ("minutes since 1990-06-01 12:00:00", 0, 1e7),
+        ]
+        for units, low, high in cases:
+            for values in [rng.uniform(low, high, 100000), rng.integers(int(low), int(high), 10000)]:
+                times = nc_times_to_datetime(values, units)
+                reference = num2date(values, units)
+                self.assertEqual(str(times.dtype), "datetime64[ns, UTC]")
+                self.assertTrue((times == reference).all(), msg=f"{units} {values.dtype}")
+
+    def test_fallback(self):
+        """Units not handled by the vectorized conversion use num2date"""
+        for values, units in [([0, 1.5, 10], "milliseconds since 2000-01-01"),
+                              ([0, 1, 123456789], "microseconds since 1980-01-01")]:
+            times = nc_times_to_datetime(np.array(values), units)
+            self.assertTrue((times == num2date(np.array(values), units)).all(), msg=units)
+
+    def test_nan(self):
+        times = nc_times_to_datetime(np.array([0, np.nan, 1.5]), "seconds since 1970-01-01")
+        self.assertEqual(times[0], pd.Timestamp("1970-01-01", tz="UTC"))
+        self.assertTrue(pd.isna(times[1]))
+        self.assertEqual(times[2], pd.Timestamp("1970-01-01 00:00:01.5", tz="UTC"))
+
+
+def empty_waterframe(columns: list) -> WaterFrame:
+    return WaterFrame(pd.DataFrame(columns=columns), {}, {c: {} for c in columns})
+
+
+class VariablesTester(unittest.TestCase):
+    def test_get_variables(self):
+        wf = empty_waterframe(["time", "DEPTH", "TEMP", "TEMP_QC", "TEMP_STD", "sensor_id", "PSAL"])
+        self.assertEqual(get_variables(wf), ["TEMP", "PSAL"])
+        self.assertEqual(get_dimensions(wf), ["time", "DEPTH", "sensor_id"])
+
+    def test_dimensions_changed(self):
+        """get_variables and get_dimensions agree after the dimensions list is modified, as export_to_netcdf does"""
+        wf = empty_waterframe(["TIME", "TEMP", "SENSOR_ID"])
+        self.assertEqual(get_variables(wf), ["TEMP"])
+        dimensions.remove("SENSOR_ID")
+        try:
+            self.assertEqual(get_variables(wf), ["TEMP", "SENSOR_ID"])
+            self.assertEqual(get_dimensions(wf), ["TIME"])
+        finally:
+            dimensions.append("SENSOR_ID")
+
+
+@pytest.mark.usefixtures("tmpdir_path")
+class CsvDetectHeaderTester(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(self.tmpdir, "data.csv")
+
+    def detect_header(self, header: list, nrows: int, newline="\n", **kwargs):
+        """
+        Writes a CSV file with some header lines followed by a column names line and nrows of data
+        :returns: number of header lines detected
+        """
+        lines = header + ["time,temp,psal"] + [f"2020-01-01T00:{i % 60:02d}:00Z,{i * 0.01:.2f},38.{i}"
+                                              for i in range(nrows)]
+        with open(self.filename, "w", newline="") as f:
+            f.write(newline.join(lines) + newline)
+        return csv_detect_header(self.filename, **kwargs)
+
+    def test_short_file(self):
+        """Files shorter than tail_size are read at once"""
+        header = ["# Some header", "# without separators"]
+        self.assertEqual(self.detect_header(header, 5), 2)
+        self.assertLess(os.path.getsize(self.filename), 65536)
+        self.assertEqual(self.detect_header([], 5), 0)
+        self.assertEqual(self.detect_header([], 1), 0)  # too few lines, the first line is the header
+
+    def test_long_file(self):
+        """Only the tail is read, its first (truncated) line is discarded"""
+        header = ["# header line"] * 3
+        for tail_size in [10, 64, 100, 1000, 65536]:
+            self.assertEqual(self.detect_header(header, 5000, tail_size=tail_size), 3, msg=f"{tail_size}")
+        self.assertGreater(os.path.getsize(self.filename), 65536)
+
+    def test_header_longer_than_tail(self):
+        """The header is longer than the tail that is read"""
+        header = [f"# header line {i}" for i in range(5000)]
+        self.assertEqual(self.detect_header(header, 10), 5000)
+        self.assertGreater(os.path.getsize(self.filename), 65536)
+        header = ["# a single header line much longer than the tail " * 10]
+        self.assertEqual(self.detect_header(header, 10, tail_size=64), 1)
+
+    def test_crlf(self):
+        """Windows line endings, the tail may start in the middle of a \\r\\n"""
+        header = ["# header", "# lines"]
+        self.assertEqual(self.detect_header(header, 10, newline="\r\n"), 2)
+        for tail_size in range(20, 200):
+            self.assertEqual(self.detect_header(header, 50, newline="\r\n", tail_size=tail_size), 2,
+                             msg=f"{tail_size}")
+        self.assertEqual(self.detect_header(header, 50, newline="\r", tail_size=100), 2)
+
+    def test_invalid(self):
+        with open(self.filename, "w") as f:
+            f.write("a,b\n1,2\n1,2,3\n4\n5\n")
+        with self.assertRaises(ValueError):
+            csv_detect_header(self.filename)
+        with open(self.filename, "w") as f:
+            f.write("a\n1\n2\n3\n4\n")
+        with self.assertRaises(ValueError):
+            csv_detect_header(self.filename)
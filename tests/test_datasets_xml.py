@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the datasets.xml tools, they do not require ERDDAP
+
+license: MIT
+created: 16/10/26
+"""
+import os
+import shutil
+import unittest
+
+import lxml.etree as etree
+import pytest
+
+from src.emso_metadata_harmonizer.erddap.datasets_xml import add_dataset
+
+datasets_xml = """<?xml version="1.0" encoding="UTF-8"?>
+<!-- comment before the root element -->
+<erddapDatasets>
+    <!-- comment within the root element -->
+    <requestBlacklist></requestBlacklist>
+    <dataset type="EDDTableFromMultidimNcFiles" datasetID="existing" active="true">
+        <fileDir>/data/existing</fileDir>
+        <addAttributes>
+            <att name="title">Existing &amp; dataset</att>
+        </addAttributes>
+    </dataset>
+    <user username="user" password="pass" roles="role"/>
+</erddapDatasets>
+"""
+
+new_dataset = """<dataset type="EDDTableFromMultidimNcFiles" datasetID="new" active="true">
+    <fileDir>/data/new</fileDir>
+</dataset>
+"""
+
+
+def top_level_elements(filename):
+    """
+    Returns the serialization of all the elements (and comments) directly under the root of a XML file
+    """
+    root = etree.parse(filename, etree.XMLParser(remove_blank_text=True)).getroot()
+    return [etree.tostring(elem, with_tail=False) for elem in root]
+
+
+@pytest.mark.usefixtures("tmpdir_path")
+class DatasetsXmlTester(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(self.tmpdir, "datasets.xml")
+        with open(self.filename, "w") as f:
+            f.write(datasets_xml)
+
+    def test_add_dataset(self):
+        """Appends a new dataset, keeping all the existing contents"""
+        original = top_level_elements(self.filename)
+        add_dataset(self.filename, new_dataset)
+
+        result = top_level_elements(self.filename)
+        self.assertEqual(result[:-1], original)
+        new = etree.fromstring(result[-1])
+        self.assertEqual(new.tag, "dataset")
+        self.assertEqual(new.attrib["datasetID"], "new")
+        self.assertEqual(new.find("fileDir").text, "/data/new")
+
+        with open(self.filename) as f:
+            contents = f.read()
+        self.assertIn("<!-- comment before the root element -->", contents)
+
+        # The previous contents are kept in a backup file
+        backups = [f for f in os.listdir(self.tmpdir) if f.startswith(".datasets.xml.")]
+        self.assertEqual(len(backups), 1)
+        with open(os.path.join(self.tmpdir, backups[0])) as f:
+            self.assertEqual(f.read(), datasets_xml)
+
+    def test_overwrite_dataset(self):
+        """Adding a dataset with an existing datasetID replaces it"""
+        add_dataset(self.filename, new_dataset)
+        add_dataset(self.filename, new_dataset.replace("/data/new", "/data/updated"))
+        root = etree.parse(self.filename).getroot()
+        datasets = root.findall("dataset[@datasetID='new']")
+        self.assertEqual(len(datasets), 1)
+        self.assertEqual(datasets[0].find("fileDir").text, "/data/updated")
+        self.assertEqual(len(root.findall("dataset[@datasetID='existing']")), 1)
+
+    def test_default_datasets_xml(self):
+        """The datasets.xml shipped with the tests is preserved"""
+        default = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conf", "datasets_default.xml")
+        shutil.copy(default, self.filename)
+        original = top_level_elements(self.filename)
+        add_dataset(self.filename, new_dataset)
+        result = top_level_elements(self.filename)
+        self.assertEqual(result[:-1], original)
+        self.assertEqual(etree.fromstring(result[-1]).attrib["datasetID"], "new")
+
+    def test_after_root(self):
+        """Comments and processing instructions after the root element are kept after it"""
+        with open(self.filename, "w") as f:
+            f.write(datasets_xml + "<!-- trailing -->\n<?pi after root?>\n")
+        add_dataset(self.filename, new_dataset)
+        tree = etree.parse(self.filename)
+        root = tree.getroot()
+        self.assertEqual(root[-1].attrib["datasetID"], "new")
+        self.assertEqual(len(root.xpath("comment()[contains(., 'trailing')]")), 0)
+        following = root.itersiblings()
+        self.assertEqual(next(following).text, " trailing ")
+        self.assertEqual(next(following).target, "pi")
+        self.assertEqual(len(tree.xpath("/comment()[contains(., 'comment before the root')]")), 1)
+
+    def test_namespaced_root(self):
+        """The closing tag of a root element with a namespace prefix is well formed"""
+        with open(self.filename, "w") as f:
+            f.write(datasets_xml.replace("<erddapDatasets>", '<e:erddapDatasets xmlns:e="http://example.org/erddap">')
+                    .replace("</erddapDatasets>", "</e:erddapDatasets>"))
+        original = top_level_elements(self.filename)
+        add_dataset(self.filename, new_dataset)
+        with open(self.filename) as f:
+            self.assertTrue(f.read().rstrip().endswith("</e:erddapDatasets>"))
+        result = top_level_elements(self.filename)
+        root = etree.parse(self.filename).getroot()
+        self.assertEqual(etree.QName(root).text, "{http://example.org/erddap}erddapDatasets")
+        self.assertEqual(result[:-1], original)
+        self.assertEqual(etree.fromstring(result[-1]).attrib["datasetID"], "new")
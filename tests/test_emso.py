@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the EMSO metadata tools, they do not require ERDDAP nor downloading the vocabularies
+
+license: MIT
+created: 16/10/26
+"""
+import os
+import unittest
+
+import pandas as pd
+import pytest
+
+from src.emso_metadata_harmonizer.metadata.emso import EmsoMetadata, process_markdown_file, load_markdown_tables
+
+p01 = "http://vocab.nerc.ac.uk/collection/P01/current/"
+
+markdown = """# EMSO codes
+Some text before the tables
+
+## EMSO Facilities
+| EMSO Facility | long name | Active |
+|---------------|-----------|--------|
+| OBSEA | OBSEA Underwater Observatory  | true |
+|   Azores   | Azores "quoted" name | False
+| NA | null | True |
+
+## Mixed values
+|name|value|flag|
+|---|---|---|
+|a|1.0|true|
+|b||other|
+|c|'single' quotes, commas|False|
+|  |  N/A  |  |
+
+## Empty table
+| header 1 | header 2 |
+|----------|----------|
+
+## Table at the end of the file
+| code | description |
+|------|-------------|
+| X1 | first |
+| X2 | second with <sup>1</sup> annotation |"""
+
+
+def reference_markdown_parser(lines) -> dict:
+    """
+    Row by row parser, as process_markdown_file used to parse the tables
+    """
+    title = ""
+    tables = {}
+    in_table = False
+    for line in lines + ["\n"]:  # add an empty line to force table end
+        line = line.strip()
+        if line.startswith("#"):
+            title = line.strip().replace("#", "").strip()
+        elif not in_table and line.startswith("|"):
+            if not line.endswith("|"):
+                line += "|"
+            headers = [h.strip() for h in line.strip().split("|")][1:-1]
+            table = {header: [] for header in headers}
+            in_table = True
+        elif in_table and not line.startswith("|"):
+            in_table = False
+            tables[title] = pd.DataFrame(table)
+        elif line.startswith("|---"):
+            continue
+        elif line.startswith("|"):
+            if not line.endswith("|"):
+                line += "|"
+            fields = [f.strip() for f in line.split("|")[1:-1]]
+            for i in range(len(fields)):
+                if fields[i] in ["false", "False"]:
+                    table[headers[i]].append(False)
+                elif fields[i] in ["true", "True"]:
+                    table[headers[i]].append(True)
+                else:
+                    table[headers[i]].append(fields[i])
+    return tables
+
+
+@pytest.mark.usefixtures("tmpdir_path")
+class MarkdownTablesTester(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(self.tmpdir, "tables.md")
+        with open(self.filename, "w", encoding="utf-8") as f:
+            f.write(markdown)
+
+    def test_process_markdown_file(self):
+        tables = process_markdown_file(self.filename)
+        self.assertEqual(list(tables.keys()), ["EMSO Facilities", "Mixed values", "Empty table",
+                                               "Table at the end of the file"])
+
+        facilities = tables["EMSO Facilities"]
+        self.assertEqual(list(facilities.columns), ["EMSO Facility", "long name", "Active"])
+        self.assertEqual(facilities["EMSO Facility"].tolist(), ["OBSEA", "Azores", "NA"])
+        self.assertEqual(facilities["long name"].tolist(), ["OBSEA Underwater Observatory", 'Azores "quoted" name',
+                                                            "null"])
+        self.assertEqual(facilities["Active"].tolist(), [True, False, True])
+        self.assertEqual(facilities["Active"].dtype, bool)
+
+        mixed = tables["Mixed values"]
+        self.assertEqual(mixed["value"].tolist(), ["1.0", "", "'single' quotes, commas", "N/A"])
+        self.assertEqual(mixed["flag"].tolist(), [True, "other", False, ""])
+        self.assertEqual(mixed["name"].tolist(), ["a", "b", "c", ""])
+
+        self.assertEqual(len(tables["Empty table"]), 0)
+        self.assertEqual(list(tables["Empty table"].columns), ["header 1", "header 2"])
+        self.assertEqual(tables["Table at the end of the file"]["description"].tolist(),
+                         ["first", "second with <sup>1</sup> annotation"])
+
+    def test_same_as_row_parser(self):
+        """The tables must be the same as the ones obtained parsing them row by row"""
+        with open(self.filename, encoding="utf-8") as f:
+            reference = reference_markdown_parser(f.readlines())
+        tables = process_markdown_file(self.filename)
+        self.assertEqual(tables.keys(), reference.keys())
+        for title, df in tables.items():
+            self.assertEqual(list(df.columns), list(reference[title].columns), msg=title)
+            if len(df):
+                pd.testing.assert_frame_equal(df.reset_index(drop=True), reference[title], check_dtype=False,
+                                              obj=title)
+                for column in df.columns:
+                    self.assertEqual(df[column].tolist(), reference[title][column].tolist(), msg=title)
+
+    def test_load_markdown_tables_cache(self):
+        """Tables are cached in a .pkl file, which is ignored once the Markdown file changes"""
+        tables = load_markdown_tables(self.filename)
+        self.assertTrue(os.path.isfile(self.filename + ".pkl"))
+        cached = load_markdown_tables(self.filename)
+        self.assertEqual(cached.keys(), tables.keys())
+        pd.testing.assert_frame_equal(cached["EMSO Facilities"], tables["EMSO Facilities"])
+
+        with open(self.filename, "a", encoding="utf-8") as f:
+            f.write("\n\n# New table\n| a | b |\n|---|---|\n| 1 | 2 |\n")
+        tables = load_markdown_tables(self.filename)
+        self.assertEqual(tables["New table"]["b"].tolist(), ["2"])
+
+
+@pytest.mark.usefixtures("tmpdir_path")
+class EmsoRelationsTester(unittest.TestCase):
+    def setUp(self):
+        # Build an instance without downloading the vocabularies, only with the attributes used by get_relations
+        self.emso = EmsoMetadata.__new__(EmsoMetadata)
+        self.emso.sdn_vocabs_related = {"P01": {
+            p01 + "TEMP/": [p01 + "OTHER/", "http://vocab.nerc.ac.uk/collection/P06/current/UPAA/"],
+            p01 + "PSAL/": "http://vocab.nerc.ac.uk/collection/P06/current/UUUU/",
+        }}
+        self.emso.sdn_vocabs_broader = {"P01": {p01 + "TEMP/": []}}
+        self.emso.sdn_vocabs_narrower = {"P01": {}}
+        self.emso.sdn_relations_by_target = {}
+
+    def test_get_relations(self):
+        uri = "https://vocab.nerc.ac.uk/collection/P01/current/TEMP"  # harmonized to http and trailing /
+        expected = ["http://vocab.nerc.ac.uk/collection/P06/current/UPAA/"]
+        self.assertEqual(self.emso.get_relations("P01", uri, "related", "P06"), expected)
+        # Callers may modify the result without altering the following queries
+        self.emso.get_relations("P01", uri, "related", "P06").append("modified")
+        self.assertEqual(self.emso.get_relations("P01", uri, "related", "P06"), expected)
+
+        self.assertEqual(self.emso.get_relations("P01", p01 + "PSAL/", "related", "P06"),
+                         ["http://vocab.nerc.ac.uk/collection/P06/current/UUUU/"])
+        self.assertEqual(self.emso.get_relations("P01", p01 + "PSAL/", "related", "P07"), [])
+        self.assertEqual(self.emso.get_relations("P01", p01 + "TEMP/", "broader", "P07"), [])
+        self.assertEqual(self.emso.get_relations("P01", p01 + "XXXX/", "related", "P06"), "")  # not found
+        self.assertEqual(self.emso.get_relation("P01", uri, "related", "P06"), expected[0])
+        with self.assertRaises(LookupError):
+            self.emso.get_relations("P01", uri, "unrelated", "P06")
+
+    def test_relations_not_stored(self):
+        """The relation maps built by get_relations are not stored in the state cache"""
+        self.emso.get_relations("P01", p01 + "TEMP/", "related", "P06")
+        self.assertTrue(self.emso.sdn_relations_by_target)
+        state_file = os.path.join(self.tmpdir, "state.pkl")
+        self.emso._EmsoMetadata__store_state(state_file, "key")
+
+        restored = EmsoMetadata.__new__(EmsoMetadata)
+        self.assertTrue(restored._EmsoMetadata__load_state(state_file, "key"))
+        self.assertEqual(restored.sdn_relations_by_target, {})
+        self.assertEqual(restored.sdn_vocabs_related, self.emso.sdn_vocabs_related)
+        self.assertEqual(restored.get_relations("P01", p01 + "TEMP/", "related", "P06"),
+                         ["http://vocab.nerc.ac.uk/collection/P06/current/UPAA/"])
+        self.assertFalse(restored._EmsoMetadata__load_state(state_file, "other key"))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the minimal and full metadata files, they do not require ERDDAP
+
+license: MIT
+created: 16/10/26
+"""
+import json
+import os
+import unittest
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.emso_metadata_harmonizer.metadata.minmeta import load_full_meta, generate_full_metadata, np_encoder
+from src.emso_metadata_harmonizer.metadata.waterframe import WaterFrame
+
+
+@pytest.mark.usefixtures("tmpdir_path")
+class MinmetaTester(unittest.TestCase):
+    def test_load_full_meta_nan(self):
+        """Full metadata files written by the json library may contain NaN literals"""
+        filename = os.path.join(self.tmpdir, "data.full.json")
+        with open(filename, "w") as f:
+            f.write('{"global": {"title": "test"}, "variables": {"TEMP": {"sensor_serial_number": "1234", '
+                    '"valid_min": NaN, "valid_max": Infinity}}}')
+        wf = WaterFrame(pd.DataFrame(), {}, {})
+        metadata = load_full_meta(wf, filename)
+        self.assertTrue(math.isnan(metadata["variables"]["TEMP"]["valid_min"]))
+        self.assertEqual(metadata["variables"]["TEMP"]["valid_max"], math.inf)
+        self.assertEqual(wf.metadata["$sensor_id"], "1234")
+        self.assertEqual(wf.metadata["$fullmeta"], filename)
+
+    def test_np_encoder(self):
+        """Numpy scalars are converted to Python numbers and arrays to lists"""
+        for value, expected in [(np.float32(-2.5), -2.5), (np.int64(2 ** 40), 2 ** 40), (np.int8(3), 3),
+                                (np.bool_(True), True), (np.array([0, 1, 2], dtype=np.int8), [0, 1, 2]),
+                                (np.array([[1.5], [2.5]]), [[1.5], [2.5]])]:
+            result = np_encoder(value)
+            self.assertEqual(result, expected)
+            self.assertEqual(type(result), type(expected))
+        self.assertIsNone(np_encoder(object()))
+
+    def test_full_metadata_numpy(self):
+        """Full metadata with numpy values is written with Python numbers and lists and loaded back"""
+        vocabulary = {
+            "TEMP": {
+                "sensor_serial_number": "1234",
+                "valid_min": np.float32(-2.5),
+                "valid_max": np.nan,
+                "flag_values": np.array([0, 1, 2], dtype=np.int8),
+                "count": np.int64(2 ** 40)
+            }
+        }
+        wf = WaterFrame(pd.DataFrame(), {"title": "test", "$datafile": "dir.1/data.v2.nc"}, vocabulary)
+        generate_full_metadata(wf, self.tmpdir)
+        filename = os.path.join(self.tmpdir, "data.v2.full.json")
+        with open(filename) as f:
+            contents = json.load(f)
+        self.assertEqual(contents["variables"]["TEMP"]["flag_values"], [0, 1, 2])  # not null
+
+        metadata = load_full_meta(WaterFrame(pd.DataFrame(), {}, {}), filename)
+        temp = metadata["variables"]["TEMP"]
+        self.assertEqual(temp["valid_min"], -2.5)
+        self.assertTrue(math.isnan(temp["valid_max"]))
+        self.assertEqual(temp["flag_values"], [0, 1, 2])
+        self.assertEqual(temp["count"], 2 ** 40)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the miscellaneous functions, they do not require ERDDAP
+
+license: MIT
+created: 16/10/26
+"""
+import json
+import os
+import unittest
+
+import pytest
+
+from src.emso_metadata_harmonizer.metadata.utils import iter_json_items
+
+
+@pytest.mark.usefixtures("tmpdir_path")
+class IterJsonItemsTester(unittest.TestCase):
+    def setUp(self):
+        self.filename = os.path.join(self.tmpdir, "test.json")
+
+    def items(self, text, key="@graph"):
+        with open(self.filename, "w", encoding="utf-8") as f:
+            f.write(text)
+        return list(iter_json_items(self.filename, key))
+
+    def assert_same_as_json(self, text, key="@graph"):
+        """The elements must be the same as the ones decoded by json.loads"""
+        self.assertEqual(self.items(text, key), json.loads(text)[key])
+
+    def test_nested(self):
+        doc = {
+            "@context": {"skos": "http://www.w3.org/2004/02/skos/core#", "list": [1, [2, {"@graph": [3]}]]},
+            "@graph": [
+                {"@id": "a", "skos:related": [{"@id": "b"}, {"@id": "c", "x": {"y": [[], {}, [[1.5e3]]]}}]},
+                [1, 2, [3, [4]]],
+                {"@graph": ["not", "top", "level"]},
+                "string", 12, -3.25, True, False, None, {}, []
+            ],
+            "after": {"@graph": [0]}
+        }
+        self.assert_same_as_json(json.dumps(doc))
+        self.assert_same_as_json(json.dumps(doc, indent=4))
+
+    def test_escaped(self):
+        doc = {
+            "\"@graph\"": ["decoy key with quotes"],
+            "@graph": [
+                "brackets ] } [ { and commas , : inside a string",
+                "escaped \" quote and backslash \\",
+                {"key \"with\" quotes": "\\\" ]"},
+                "unicode é中😀",
+                "newline\nand\ttab"
+            ]
+        }
+        self.assert_same_as_json(json.dumps(doc))
+        self.assert_same_as_json(json.dumps(doc, ensure_ascii=False))
+
+    def test_whitespace(self):
+        text = ' \n\t { \r\n "other" \n : \t [ 1 , 2 ] \n , \n\n "@graph"  :\n[\n\n {"a" :\n 1 } \n,\t\n' \
+               '  "b"  ,\r\n [ ]\n\n ]\n , "last" : null \n } \n '
+        self.assert_same_as_json(text)
+
+    def test_empty(self):
+        self.assertEqual(self.items('{"@graph": []}'), [])
+        self.assertEqual(self.items('{"@graph":[ \n ]}'), [])
+
+    def test_missing_key(self):
+        with self.assertRaises(LookupError):
+            self.items('{"other": {"@graph": [1]}}')
+        with self.assertRaises(LookupError):
+            self.items('{}')
+
+    def test_malformed(self):
+        for text in ['[1, 2]', '{"@graph": 1}', '{"@graph": [1 2]}', '{"@graph": [1, 2', '{"@graph": [1,',
+                     '{"a": 1 "@graph": [1]}', '{"a": 1', '']:
+            with self.assertRaises(ValueError, msg=text):
+                self.items(text)